@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+# coding: utf8
+
+# Music Library Converter - Benchmark
+# Required Python libraries: Pillow
+# Other Requirements: ffmpeg (with libmp3lame), a POSIX system (for measuring the resource usage)
+
+# Generates a synthetic music library and runs the converter on it in different modes.
+# For every run the wall time, CPU time, peak memory usage and throughput are recorded as JSON.
+
+import sys
+import os
+import shutil
+import subprocess
+import time
+import getopt
+import json
+import random
+import platform
+import tempfile
+import statistics
+from PIL import Image
+
+#Variables and Constants
+#------------------------
+
+short_options = "ho:j:r:"
+long_options = ["help", "output=", "jobs=", "repeat=", "albums=", "tracks=", "duration=", "library=", "keep"]
+settings = {
+    "output_file": "",
+    "jobs": os.cpu_count() or 1,
+    "repeat": 1,
+    "albums": 6,
+    "tracks": 8,
+    "duration": 20,
+    "library_path": "",
+    "keep": False
+}
+helptext = "USAGE: {0} [OPTIONS]\n\nGenerates a synthetic music library and measures the performance of the converter in different modes.\n\n   -h          --help                  Displays this Help Message and exits\n   -o <file>   --output=<file>         Writes the results to <file> instead of printing them\n   -j <count>  --jobs=<count>          Number of parallel jobs passed to the converter. Defaults to the number of CPU cores\n   -r <count>  --repeat=<count>        Number of times every mode is run. Defaults to 1\n               --albums=<count>        Number of generated albums. Defaults to 6\n               --tracks=<count>        Number of tracks per album. Defaults to 8\n               --duration=<seconds>    Duration of every generated track. Defaults to 20\n               --library=<dir>         Uses (or generates, if it does not exist) the library in <dir> instead of a temporary one\n               --keep                  Keeps the temporary library and destinations after the benchmark"
+
+converter_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "convert-music-library.py")
+
+#Benchmarked modes: Name, converter arguments and if the destination of the previous run is reused. '{dest}' is replaced by the destination of the run.
+benchmark_modes = [
+    ("plain", [], False),
+    ("rerun", [], True),
+    ("convert-cover", ["-c"], False),
+    ("scale-cover", ["-s", "500"], False),
+    ("convert-scale-cover", ["-c", "-s", "500"], False),
+    ("copy-lyrics", ["-l"], False),
+    ("fan-out", ["--profile=archive:dest={dest}/archive", "--profile=phone:dest={dest}/phone,mode=vbr,convert-cover,scale-cover=500", "--profile=car:dest={dest}/car,codec=opus"], False)
+]
+
+#Cover variations: Format and size. Noise makes the covers as hard to compress as real photos.
+cover_variants = [
+    ("PNG", 500),
+    ("PNG", 1500),
+    ("PNG", 3000),
+    ("JPEG", 600),
+    ("JPEG", 1400),
+    (None, 0)
+]
+
+#Functions
+#----------
+
+# Function: checkParameters()
+# Description: Checks if passed arguments are valid and sets the 'settings'-variables accordingly.
+
+def checkParameters():
+    try:
+        option_args, other_args = getopt.gnu_getopt(sys.argv[1:], short_options, long_options)
+    except getopt.error as err:
+        print("[ERROR] "+str(err))
+        sys.exit(2)
+    
+    for arg, val in option_args:
+        if arg in ("-h", "--help"):
+            print(helptext.format(os.path.basename(sys.argv[0])))
+            sys.exit(0)
+        elif arg in ("-o", "--output"):
+            settings["output_file"] = os.path.abspath(val)
+        elif arg == "--library":
+            settings["library_path"] = os.path.abspath(val)
+        elif arg == "--keep":
+            settings["keep"] = True
+        elif arg in ("-j", "--jobs", "-r", "--repeat", "--albums", "--tracks", "--duration"):
+            if not (val.isdigit() and int(val) > 0):
+                print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected positive Integer!")
+                sys.exit(2)
+            
+            key = {"-j": "jobs", "-r": "repeat"}.get(arg, arg.lstrip("-"))
+            settings[key] = int(val)
+
+# Function: generateCover(path, cover_format, size, rng)
+# Arguments:
+#   - path: Path of the image file
+#   - cover_format: "PNG" or "JPEG"
+#   - size: Width and height of the cover
+#   - rng: Random number generator
+# Description: Generates a cover consisting of a colored gradient with noise. The noise is generated at a quarter of the size, so the covers are about as large as scanned covers.
+
+def generateCover(path, cover_format, size, rng):
+    noise = Image.frombytes("L", (size // 4, size // 4), rng.randbytes((size // 4) * (size // 4))).resize((size, size))
+    gradient = Image.linear_gradient("L").resize((size, size))
+    cover = Image.merge("RGB", (noise, gradient, Image.new("L", (size, size), rng.randrange(256))))
+    cover.save(path, format=cover_format)
+
+# Function: runFFmpeg(arguments)
+# Arguments:
+#   - arguments: Arguments passed to ffmpeg
+# Description: Runs ffmpeg and exits if it fails.
+
+def runFFmpeg(arguments):
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"] + arguments, capture_output=True, text=True)
+    
+    if result.returncode != 0:
+        print("[ERROR] ffmpeg failed: "+result.stderr.strip())
+        sys.exit(1)
+
+# Function: generateLibrary(path)
+# Arguments:
+#   - path: Directory, in which the library is generated
+# Description: Generates a library of nested artist and album directories. Albums alternate between FLAC and MP3 tracks with covers of different formats and sizes, some tracks have no cover and some have LRC-files. The library is always the same for the same settings.
+
+def generateLibrary(path):
+    rng = random.Random(1)
+    covers_path = os.path.join(path, ".covers")
+    os.makedirs(covers_path, exist_ok=True)
+    
+    for album in range(settings["albums"]):
+        album_path = os.path.join(path, "Artist {0:02d}".format(album // 2 + 1), "Album {0:02d}".format(album + 1))
+        os.makedirs(album_path, exist_ok=True)
+        
+        extension = "flac" if album % 3 != 2 else "mp3"
+        cover_format, cover_size = cover_variants[album % len(cover_variants)]
+        cover_path = None
+        
+        if cover_format is not None:
+            cover_path = os.path.join(covers_path, "cover{0}.{1}".format(album, cover_format.lower()))
+            generateCover(cover_path, cover_format, cover_size, rng)
+        
+        for track in range(settings["tracks"]):
+            track_path = os.path.join(album_path, "{0:02d} Track.{1}".format(track + 1, extension))
+            
+            #Tone and noise alternate, as they compress very differently
+            if track % 2 == 0:
+                source = "sine=frequency={0}:duration={1}:sample_rate=44100".format(rng.randrange(200, 2000), settings["duration"])
+            else:
+                source = "anoisesrc=duration={0}:color=pink:amplitude=0.3:sample_rate=44100".format(settings["duration"])
+            
+            arguments = ["-f", "lavfi", "-i", source]
+            
+            #Every fifth track has no cover
+            if cover_path is not None and track % 5 != 4:
+                arguments += ["-i", cover_path, "-map", "0:a", "-map", "1:v", "-c:v", "copy", "-disposition:v", "attached_pic"]
+            
+            arguments += ["-ac", "2", "-metadata", "title=Track {0}".format(track + 1), "-metadata", "album=Album {0}".format(album + 1), "-metadata", "artist=Artist {0}".format(album // 2 + 1), "-metadata", "track={0}".format(track + 1)]
+            
+            if extension == "mp3":
+                arguments += ["-c:a", "libmp3lame", "-b:a", "256k", "-id3v2_version", "3"]
+            else:
+                arguments += ["-c:a", "flac"]
+            
+            runFFmpeg(arguments + [track_path])
+            
+            #Every third track has lyrics
+            if track % 3 == 0:
+                with open(os.path.join(album_path, "{0:02d} Track.lrc".format(track + 1)), "w") as f:
+                    for second in range(0, settings["duration"], 5):
+                        f.write("[{0:02d}:{1:02d}.00]Line at {1} seconds\n".format(second // 60, second % 60))
+    
+    shutil.rmtree(covers_path)
+
+# Function: describeLibrary(path)
+# Arguments:
+#   - path: Path of the library
+# Description: Counts the files and bytes of every file type in the library.
+
+def describeLibrary(path):
+    description = {}
+    
+    for root, dirs, files in os.walk(path):
+        for filename in files:
+            extension = os.path.splitext(filename)[1][1:].lower()
+            entry = description.setdefault(extension, {"files": 0, "bytes": 0})
+            entry["files"] += 1
+            entry["bytes"] += os.path.getsize(os.path.join(root, filename))
+    
+    return description
+
+# Function: runConverter(source_path, dest_path, arguments)
+# Arguments:
+#   - source_path: Path of the library
+#   - dest_path: Path of the destination
+#   - arguments: Additional arguments for the converter
+# Description: Runs the converter and measures its wall time and the resource usage of it and all processes it started (e.g. ffmpeg).
+
+def runConverter(source_path, dest_path, arguments):
+    command = [sys.executable, converter_path, source_path, dest_path, "-n", "--no-progress", "-j", str(settings["jobs"])] + arguments
+    
+    starttime = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    #wait4 returns the resource usage of the converter including all of its waited for child processes
+    pid, status, usage = os.wait4(process.pid, 0)
+    walltime = time.perf_counter() - starttime
+    process.returncode = os.waitstatus_to_exitcode(status)
+    
+    return {
+        "exit_code": process.returncode,
+        "wall_time": walltime,
+        "cpu_user": usage.ru_utime,
+        "cpu_system": usage.ru_stime,
+        #ru_maxrss is given in bytes on macOS and in kilobytes everywhere else
+        "peak_rss_kb": usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    }
+
+# Function: getFFmpegVersion()
+# Description: Returns the first line of the version output of ffmpeg.
+
+def getFFmpegVersion():
+    result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True)
+    return result.stdout.split("\n")[0]
+
+#Main Code
+#----------
+
+checkParameters()
+
+if not hasattr(os, "wait4"):
+    print("[ERROR] The benchmark needs 'os.wait4' and can't be run on this system!")
+    sys.exit(1)
+
+workdir = tempfile.mkdtemp(prefix="cml_bench_")
+
+if settings["library_path"] != "":
+    library_path = settings["library_path"]
+else:
+    library_path = os.path.join(workdir, "library")
+
+if not os.path.exists(library_path):
+    print("Generating library in "+library_path+"...")
+    generatetime = time.perf_counter()
+    generateLibrary(library_path)
+    print("Generated library in {0:.1f} seconds".format(time.perf_counter() - generatetime))
+
+library = describeLibrary(library_path)
+source_files = library.get("flac", {"files": 0})["files"] + library.get("mp3", {"files": 0})["files"]
+
+results = {
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "cpu_count": os.cpu_count(),
+    "ffmpeg": getFFmpegVersion(),
+    "settings": settings,
+    "library": library,
+    "runs": []
+}
+
+dest_path = None
+
+try:
+    for mode, arguments, reuse_destination in benchmark_modes:
+        runs = []
+        
+        for i in range(settings["repeat"]):
+            #Every run starts with a fresh destination, unless it should reuse the one of the previous mode
+            if not reuse_destination or dest_path is None:
+                dest_path = tempfile.mkdtemp(prefix="dest_", dir=workdir)
+            
+            #Every profile produces its own copy of the library
+            files = (source_files + (library.get("lrc", {"files": 0})["files"] if "-l" in arguments else 0)) * max(1, sum(1 for argument in arguments if argument.startswith("--profile")))
+            run = runConverter(library_path, dest_path, [argument.replace("{dest}", dest_path) for argument in arguments])
+            run["files"] = files
+            run["files_per_second"] = files / run["wall_time"] if run["wall_time"] > 0 else 0
+            runs.append(run)
+            
+            print("{0:<20} run {1}: {2:7.2f}s wall, {3:7.2f}s CPU, {4:8.1f} files/s, {5:7d} KB peak RSS{6}".format(mode, i + 1, run["wall_time"], run["cpu_user"] + run["cpu_system"], run["files_per_second"], run["peak_rss_kb"], "" if run["exit_code"] == 0 else " (exit code "+str(run["exit_code"])+")"))
+        
+        results["runs"].append({
+            "mode": mode,
+            "arguments": arguments,
+            "median_wall_time": statistics.median(run["wall_time"] for run in runs),
+            "median_files_per_second": statistics.median(run["files_per_second"] for run in runs),
+            "runs": runs
+        })
+finally:
+    if not settings["keep"]:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        print("Kept benchmark files in "+workdir)
+
+if settings["output_file"] != "":
+    with open(settings["output_file"], "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to "+settings["output_file"])
+else:
+    print(json.dumps(results, indent=2))
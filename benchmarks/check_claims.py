@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+# coding: utf8
+
+# Music Library Converter - Claim Check
+# Required Python libraries: Pillow (imported by the converter package)
+
+# Starts several processes sharing a temporary claim directory and checks that every file is claimed by exactly one of them,
+# that stale leases are stolen by exactly one of them and that done markers only skip files planned before they were processed.
+
+import sys
+import os
+import time
+import getopt
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from music_library_converter.jobs import ConversionJob
+from music_library_converter.workers import WorkClaims
+
+#Variables and Constants
+#------------------------
+
+short_options = "hp:f:r:"
+long_options = ["help", "processes=", "files=", "rounds="]
+settings = {
+    "processes": 8,
+    "files": 200,
+    "rounds": 20
+}
+helptext = "USAGE: {0} [OPTIONS]\n\nChecks the claims of several converters sharing a claim directory using processes on this host.\n\n   -h          --help                  Displays this Help Message and exits\n   -p <count>  --processes=<count>     Number of competing processes. Defaults to 8\n   -f <count>  --files=<count>         Number of claimed files. Defaults to 200\n   -r <count>  --rounds=<count>        Number of times stale leases are stolen. Defaults to 20"
+
+source_path = "/library"
+lease_timeout = 60
+
+#Functions
+#----------
+
+# Function: getJobs(count, planned)
+# Arguments:
+#   - count: Number of jobs
+#   - planned: Time, at which the jobs were planned
+# Description: Returns jobs for 'count' source files, which don't have to exist.
+
+def getJobs(count, planned):
+    return [ConversionJob("flac", source_path+"/"+str(index)+".flac", "", 1000, 0, planned=planned) for index in range(count)]
+
+# Function: claimAll(directory, planned, barrier, queue)
+# Arguments:
+#   - directory: Path of the claim directory
+#   - planned: Time, at which the jobs were planned
+#   - barrier: Barrier shared by all processes, so they start claiming at the same time
+#   - queue: Queue receiving the indexes of the claimed files
+# Description: Claims all files and puts the indexes of the claimed ones into the queue. The leases are kept.
+
+def claimAll(directory, planned, barrier, queue):
+    claims = WorkClaims(directory, lease_timeout)
+    jobs = getJobs(settings["files"], planned)
+    barrier.wait()
+    queue.put([index for index, job in enumerate(jobs) if claims.claim(job, source_path) is not None])
+
+# Function: runProcesses(directory, planned)
+# Arguments:
+#   - directory: Path of the claim directory
+#   - planned: Time, at which the jobs were planned
+# Description: Runs 'claimAll' in all processes and returns how often every file was claimed.
+
+def runProcesses(directory, planned):
+    barrier = multiprocessing.Barrier(settings["processes"])
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=claimAll, args=(directory, planned, barrier, queue)) for i in range(settings["processes"])]
+    
+    for process in processes:
+        process.start()
+    
+    counts = [0] * settings["files"]
+    
+    for process in processes:
+        for index in queue.get():
+            counts[index] += 1
+    
+    for process in processes:
+        process.join()
+    
+    return counts
+
+# Function: makeStale(directory, steal_locks=False)
+# Arguments:
+#   - directory: Path of the claim directory
+#   - steal_locks: If a stale steal lock is left next to every lease, as if a converter stopped while stealing it. Defaults to False.
+# Description: Sets the modification time of all leases to before the lease timeout, as if their converters stopped.
+
+def makeStale(directory, steal_locks=False):
+    stale_time = time.time() - 2 * lease_timeout
+    
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(".lease"):
+                paths = [os.path.join(dirpath, filename)]
+                
+                if steal_locks:
+                    paths.append(paths[0]+".steal")
+                    open(paths[1], "w").close()
+                
+                for path in paths:
+                    os.utime(path, (stale_time, stale_time))
+
+# Function: check(name, condition)
+# Arguments:
+#   - name: Description of the check
+#   - condition: If the check passed
+# Description: Prints the result of the check and returns the condition.
+
+def check(name, condition):
+    print(("[OK]   " if condition else "[FAIL] ")+name)
+    return condition
+
+#Main Code
+#----------
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], short_options, long_options)
+    except getopt.GetoptError as err:
+        print("[ERROR] "+str(err))
+        sys.exit(2)
+    
+    for arg, val in opts:
+        if arg in ("-h", "--help"):
+            print(helptext.format(sys.argv[0]))
+            sys.exit(0)
+        elif arg in ("-p", "--processes", "-f", "--files", "-r", "--rounds"):
+            if not val.isdigit() or int(val) < 1:
+                print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected a positive integer!")
+                sys.exit(2)
+            
+            settings[{"-p": "processes", "-f": "files", "-r": "rounds"}.get(arg, arg[2:])] = int(val)
+    
+    passed = True
+    
+    with tempfile.TemporaryDirectory(prefix="cml-claims-") as directory:
+        planned = time.time()
+        
+        counts = runProcesses(directory, planned)
+        passed &= check("Every file is claimed by exactly one process", all(count == 1 for count in counts))
+        
+        steal_counts = []
+        
+        for i in range(settings["rounds"]):
+            makeStale(directory, i % 2 == 1)
+            steal_counts += runProcesses(directory, planned)
+        
+        passed &= check("Every stale lease is stolen by exactly one process, also after a stopped steal ("+str(settings["rounds"])+" rounds)", all(count == 1 for count in steal_counts))
+        
+        claims = WorkClaims(directory, lease_timeout)
+        jobs = getJobs(settings["files"], planned)
+        makeStale(directory)
+        leases = [claims.claim(job, source_path) for job in jobs]
+        
+        for lease in leases:
+            claims.release(lease, True)
+        
+        counts = runProcesses(directory, planned)
+        passed &= check("Done files are skipped by jobs planned before they were processed", all(count == 0 for count in counts))
+        
+        counts = runProcesses(directory, time.time())
+        passed &= check("Done files are claimed again by jobs planned afterwards", all(count == 1 for count in counts))
+    
+    sys.exit(0 if passed else 1)
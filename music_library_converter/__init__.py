@@ -0,0 +1,18 @@
+# coding: utf8
+
+# Music Library Converter
+# by JoeJoeTV - 2020,2021
+# Required Python libraries: python-resize-image, Pillow, colorama, blessings
+# Other Requirements: ffmpeg
+
+version = "1.0.1"
+
+from .jobs import ConversionJob, JobResult
+from .converter import Converter, default_settings
+from .profiles import EncodeProfile, parseProfile
+from .planner import planLibrary
+from .metadata import readAudioFileMetadata
+from .covers import convertCover, CoverCache
+from .manifest import Manifest
+
+__all__ = ["version", "ConversionJob", "JobResult", "Converter", "default_settings", "EncodeProfile", "parseProfile", "planLibrary", "readAudioFileMetadata", "convertCover", "CoverCache", "Manifest"]
@@ -0,0 +1,8 @@
+# coding: utf8
+
+# Music Library Converter
+# by JoeJoeTV - 2020,2021
+
+from .cli import main
+
+main()
@@ -0,0 +1,803 @@
+# coding: utf8
+
+# Music Library Converter - Command Line Interface
+# by JoeJoeTV - 2020,2021
+# Parses the arguments, prints the progress of a 'Converter' and writes the log and the run report
+
+
+import sys
+import os
+import subprocess
+import time
+import logging
+import getopt
+import asyncio
+import colorama
+from blessed import Terminal
+
+from . import version
+from .converter import Converter, default_settings, copy_modes
+from .profiles import parseProfile
+from .report import createReportRecord, getStageStatistics, getSlowestRecords, writeReport
+from .logs import log_formats, startLogging, stopLogging
+from .watcher import LibraryWatcher
+
+#Arguments
+# - Source Path
+# - Destination Path
+# - Options
+#   - --copy-lyrics
+#   - --copy-cue
+#   - --copy-folder-art
+#   - --scale-cover <size>
+#   - --convert-cover
+#   - --no-log-file
+#   - --jobs <count>
+#   - --hash-sources
+#   - --no-manifest
+#   - --cover-cache <directory>
+#   - --copy-mode <mode>
+#   - --dry-run
+#   - --no-progress
+#   - --report <file>
+#   - --report-slowest <count>
+#   - --profile <profile>
+#   - --mirror
+#   - --delete-orphans
+#   - --verify
+#   - --verify-decode
+#   - --quiet
+#   - --log-format <format>
+#   - --shard <index>/<count>
+#   - --claim-dir <directory>
+#   - --lease-timeout <seconds>
+#   - --replaygain
+#   - --watch
+#   - --watch-poll <seconds>
+#   - --settle-time <seconds>
+
+#Variables and Constants
+#------------------------
+
+short_options = "hvls:cnj:Hq"
+long_options = ["help", "version", "copy-lyrics", "scale-cover=", "convert-cover", "no-log-file", "jobs=", "hash-sources", "no-manifest", "cover-cache=", "copy-mode=", "dry-run", "no-progress", "report=", "report-slowest=", "profile=", "mirror", "delete-orphans", "verify", "verify-decode", "quiet", "log-format=", "copy-cue", "copy-folder-art", "shard=", "claim-dir=", "lease-timeout=", "watch", "watch-poll=", "settle-time=", "replaygain"]
+
+#Settings only used by the command line interface, in addition to the ones of the converter
+cli_settings = {
+    "generate_logfile": True,
+    "replace_files": False,
+    "show_progress": True,
+    "report_file": "",
+    "report_slowest": 10,
+    "quiet": False,
+    "log_format": "text",
+    "watch": False,
+    "watch_poll": 0,
+    "settle_time": 2
+}
+helptext = "USAGE: {0} <Source Directory> <Destination Directory> [OPTIONS]\n\nConvert Music Libraries containing MP3 and FLAC files to better fit smaller file size limitations.\n\nArguments:\n   <Source Path>                       The path where the original audio files, which are to be converted, are stored\n   <Destination Path>                  The path where the converted files should be stored\n\n   -h          --help                  Displays this Help Message and exits\n   -l          --copy-lyrics           Also copy matching Lyric-Files(LRC and TXT)\n   -s <size>   --scale-cover=<size>    Scales the cover to fit in a box width with and height of <size>\n   -c          --convert-cover         Converts the cover to the JPEG format\n   -n          --no-log-file           Disables the normally generated LOG-file. Warnings and errors are printed instead\n   -j <count>  --jobs=<count>          Number of files, which are converted/copied simultaneously. Defaults to the number of CPU cores\n   -q          --quiet                 Only prints the progress bar, failures and the summary\n   -H          --hash-sources          Also compare the content hash of source files, whose size or modification time changed, before converting them again\n               --replaygain            Measures the loudness (EBU R128) of every audio file while it is converted and writes ReplayGain tags for the track and its album (source directory). MP3 files are decoded once for all profiles\n               --copy-cue              Also copy matching cue sheets, changing references to FLAC files to the converted files\n               --copy-folder-art       Also copy folder art (folder, cover, front or album with JPG or PNG extension), which is converted and scaled like embedded covers\n               --no-manifest           Don't use the manifest in the destination directory and only check if converted files exist\n               --cover-cache=<dir>     Also stores converted covers in <dir>, so they can be reused by later runs\n               --copy-mode=<mode>      How MP3 files are copied: 'auto' clones them on file systems supporting it (reflink) and copies them inside of the kernel otherwise, 'hardlink' creates hard links if possible and 'copy' always copies the data. Defaults to 'auto'\n               --dry-run               Only scans the library, prints what would be done and exits\n               --no-progress           Prints every file instead of showing a progress bar\n               --report=<file>         Writes the timings of every file and stage to <file> (JSON, or CSV if <file> ends with '.csv') and prints a timing summary\n               --report-slowest=<n>    Number of the slowest files listed in the report. Defaults to 10\n               --profile=<profile>     Adds an output profile '<name>:<key>=<value>,...' with its own destination library. Can be given multiple times, in which case every FLAC file is only decoded once for all profiles. Keys: 'dest' (defaults to <Destination Path>), 'codec' ('mp3' or 'opus'; Opus files don't get covers), 'mode' ('cbr' or 'vbr'), 'bitrate' (like '192k'), 'quality' (MP3 VBR quality from 0 to 9), 'scale-cover', 'convert-cover' and 'replaygain' (the last two optionally '=true' or '=false'). Cover options not given default to '-s' and '-c'\n               --mirror                Moves converted files of moved or renamed source files (recognized by their size and the hash of their beginning and end) instead of converting them again. Needs the manifest\n               --delete-orphans        Like '--mirror', but also deletes converted files of source files, which no longer exist\n               --verify                Checks files, which were already converted or copied, for truncation (by walking over their frames and comparing their duration with the source) and converts or copies broken files again\n               --verify-decode         Like '--verify', but also decodes the files completely\n               --log-format=<format>   Format of the LOG-file: 'text' or 'json' (one JSON object per line, written to a '.jsonl' file). Defaults to 'text'\n               --shard=<i>/<n>         Only processes the files of shard <i> of <n>, which is determined by the hash of their path, so <n> converters can share the library without overlapping\n               --claim-dir=<dir>       Shared directory, in which every file is claimed by the converter processing it, so converters on several hosts can share the library. Files claimed or already processed by another converter are skipped\n               --lease-timeout=<sec>   Seconds after which the claim of a converter, which stopped, can be taken over. Claims are renewed while files are processed. Defaults to 120\n               --watch                 After converting the library, keeps watching it (using inotify) and converts new files as soon as they stopped growing, until Ctrl+C is pressed\n               --watch-poll=<sec>      Like '--watch', but scans the library every <sec> seconds instead of using inotify\n               --settle-time=<sec>     Seconds, for which the size of a new file must not change, before it is converted in watch mode. Defaults to 2"
+summarytext = "\nSUMMARY:\n  Found {0} files!{8}\n    - Converted:\n      - Success: {1}\n      - Failure: {2}\n    - Copied:\n      - Success: {3}\n      - Failure: {4}\n    - Exists: {5}\n    - LRC-Files Copied:\n      - Success: {6}\n      - Failure: {7}"
+plantext = "\nPLAN:\n  Found {0} files ({1})!\n    - FLAC-Files to convert: {2} ({3})\n    - MP3-Files to copy: {4} ({5})\n    - LRC-Files to copy: {6} ({7})\n    - Already present: {8} ({9})\n"
+mirrorplantext = "    - Moved files: {0} ({1})\n    - Orphaned files to delete: {2}\n"
+companionplantext = "    - Cue sheets and folder art to copy: {0} ({1})\n"
+gainplantext = "    - Existing files to tag with ReplayGain: {0} ({1})\n"
+companiontext = "    - Cue Sheets and Folder Art Copied:\n      - Success: {0}\n      - Failure: {1}"
+profilestext = "\n  Results are counted once per profile ({0} profiles)"
+verifytext = "    - Broken files replaced: {0}"
+gaintext = "    - ReplayGain Tags Added:\n      - Success: {0}\n      - Failure: {1}"
+claimtext = "    - Claimed by other converters: {0}"
+mirrortext = "    - Moved:\n      - Success: {0}\n      - Failure: {1}\n    - Orphans Deleted:\n      - Success: {2}\n      - Failure: {3}"
+timingtext = "  - {0}: {1} files, {2:.3f}s total, p50 {3:.3f}s, p95 {4:.3f}s, max {5:.3f}s"
+progresstext = "[{0}] {1}/{2} files | {3:.1f} files/s | {4:.1f} MB/s | ETA {5}"
+covercachetext = "    - Cover Cache:\n      - Hits: {0} ({1} from disk)\n      - Misses: {2}"
+configurationtext = "\nCONFIGURATION:\n  - Source Path: {0}\n  - Destination Path: {1}\n  - Generate Logfile: {2}\n  - Convert Cover to JPG: {3}\n  - Resize Cover: {4}\n  - Copy Lyrics: {5}\n  - Copy Cue Sheets: {13}\n  - Copy Folder Art: {14}\n  - Parallel Jobs: {6}\n  - Use Manifest: {7}\n  - Cover Cache Directory: {8}\n  - MP3 Copy Mode: {9}\n  - Mirror Mode: {11}\n  - Verify Existing Files: {12}\n  - Shard: {15}\n  - Claim Directory: {16}\n  - Profiles: {10}\n"
+
+#Label, color and counter name for the output of every job type
+job_outputs = {
+    "mp3": ("COPY", "green", "copy"),
+    "flac": ("CONVERT", "blue", "convert"),
+    "lrc": ("COPY LRC", "bright_yellow", "lrc_copy"),
+    "cue": ("COPY CUE", "bright_yellow", "companion_copy"),
+    "art": ("FOLDER ART", "bright_yellow", "companion_copy"),
+    "exists": ("EXISTS", "bright_magenta", "exists"),
+    "claimed": ("CLAIMED", "bright_magenta", "claimed"),
+    "move": ("MOVE", "cyan", "move"),
+    "gain": ("REPLAYGAIN", "cyan", "gain"),
+    "delete": ("DELETE", "red", "delete")
+}
+
+#Functions
+#----------
+
+# Function: isint
+# Arguments:
+#   - val: Any value
+# Description: Checks wether a given value is an integer
+
+def isint(val):
+    try:
+        int(val)
+        return True
+    except ValueError:
+        return False
+
+# Function: path_leaf
+# Arguments:
+#   - path: Any path
+# Description: Returns the leaf of a path
+
+def path_leaf(path):
+    head, tail = os.path.split(path)
+    return tail or os.path.basename(head)
+
+# Function: checkParameters(argument_list, settings)
+# Arguments:
+#   - argument_list: Arguments passed to the program, without the program name
+#   - settings: Settings, which are changed according to the options
+# Description: Checks if passed arguments are valid and sets the settings accordingly. Returns the source and destination path.
+
+def checkParameters(argument_list, settings):
+    profile_args = []
+    
+    try:
+        option_args, other_args = getopt.gnu_getopt(argument_list, short_options, long_options)
+    except getopt.error as err:
+        print("[ERROR] "+str(err))
+        sys.exit(2)
+    if (len(other_args) >= 2) and os.path.isdir(other_args[0]) and (os.path.isdir(other_args[1]) or ((not os.path.exists(other_args[1]) and os.makedirs(other_args[1])))):
+        sourcepath = os.path.abspath(other_args[0])
+        destpath = os.path.abspath(other_args[1])
+        
+        for arg, val in option_args:
+            if arg in ("-h", "--help"):
+                print(helptext)
+                sys.exit(0)
+            elif arg in ("-v", "--version"):
+                print("Version "+version)
+                sys.exit(0)
+            elif arg in ("-l", "--copy-lyrics"):
+                settings["copy_lyrics"] = True
+            elif arg == "--copy-cue":
+                settings["copy_cue"] = True
+            elif arg == "--copy-folder-art":
+                settings["copy_folder_art"] = True
+            elif arg == "--replaygain":
+                settings["replaygain"] = True
+            elif arg in ("-s", "--scale-cover"):
+                if isint(val) and val != "" and int(val) != 0:
+                    settings["scale_cover"] = True
+                    settings["cover_scale"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected Integer!")
+                    sys.exit(2)
+            elif arg in ("-c","--convert-cover"):
+                settings["convert_cover"] = True
+            elif arg in ("-n", "--no-log-file"):
+                settings["generate_logfile"] = False
+            elif arg in ("-H", "--hash-sources"):
+                settings["hash_sources"] = True
+            elif arg == "--no-manifest":
+                settings["use_manifest"] = False
+            elif arg == "--cover-cache":
+                settings["cover_cache_dir"] = os.path.abspath(val)
+            elif arg == "--dry-run":
+                settings["dry_run"] = True
+            elif arg == "--no-progress":
+                settings["show_progress"] = False
+            elif arg == "--report":
+                settings["report_file"] = os.path.abspath(val)
+            elif arg == "--report-slowest":
+                if isint(val) and int(val) >= 0:
+                    settings["report_slowest"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected Integer!")
+                    sys.exit(2)
+            elif arg == "--copy-mode":
+                if val in copy_modes:
+                    settings["copy_mode"] = val
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected one of: "+", ".join(copy_modes)+"!")
+                    sys.exit(2)
+            elif arg in ("-j", "--jobs"):
+                if isint(val) and int(val) > 0:
+                    settings["jobs"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected positive Integer!")
+                    sys.exit(2)
+            elif arg == "--profile":
+                profile_args.append(val)
+            elif arg == "--mirror":
+                settings["mirror"] = True
+            elif arg == "--delete-orphans":
+                settings["mirror"] = True
+                settings["delete_orphans"] = True
+            elif arg == "--verify":
+                settings["verify"] = True
+            elif arg == "--verify-decode":
+                settings["verify"] = True
+                settings["verify_decode"] = True
+            elif arg in ("-q", "--quiet"):
+                settings["quiet"] = True
+            elif arg == "--log-format":
+                if val in log_formats:
+                    settings["log_format"] = val
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected one of: "+", ".join(log_formats)+"!")
+                    sys.exit(2)
+            elif arg == "--shard":
+                shard_index, separator, shard_count = val.partition("/")
+                if isint(shard_index) and isint(shard_count) and 1 <= int(shard_index) <= int(shard_count):
+                    settings["shard_index"] = int(shard_index)
+                    settings["shard_count"] = int(shard_count)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected <index>/<count> with 1 <= index <= count!")
+                    sys.exit(2)
+            elif arg == "--claim-dir":
+                settings["claim_dir"] = os.path.abspath(val)
+            elif arg == "--watch":
+                settings["watch"] = True
+            elif arg == "--watch-poll":
+                if isint(val) and int(val) > 0:
+                    settings["watch"] = True
+                    settings["watch_poll"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected positive Integer!")
+                    sys.exit(2)
+            elif arg == "--settle-time":
+                if isint(val) and int(val) >= 0:
+                    settings["settle_time"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected Integer!")
+                    sys.exit(2)
+            elif arg == "--lease-timeout":
+                if isint(val) and int(val) > 0:
+                    settings["lease_timeout"] = int(val)
+                else:
+                    print("[ERROR] Invalid Value for Argument '"+arg+"': "+str(val)+". Expected positive Integer!")
+                    sys.exit(2)
+        
+        #Profiles are parsed last, as they default to the other options
+        profiles = []
+        for val in profile_args:
+            try:
+                profiles.append(parseProfile(val, settings))
+            except ValueError as err:
+                print("[ERROR] Invalid Value for Argument '--profile': "+str(val)+". "+str(err)+"!")
+                sys.exit(2)
+        settings["profiles"] = profiles
+        
+        return sourcepath, destpath
+    elif len(other_args) == 0:
+        if len(option_args) > 0:
+            for arg, val in option_args:
+                if arg in ("-h", "--help"):
+                    print(helptext.format(path_leaf(sys.argv[0])))
+                    sys.exit(0)
+                elif arg in ("-v", "--version"):
+                    print("Version "+version)
+                    sys.exit(0)
+        else:
+            print(helptext.format(path_leaf(sys.argv[0])))
+            sys.exit(0)
+    else:
+        print("[ERROR] Invalid source and/or destination path!\nSee '--help' for usage options.")
+        sys.exit(2)
+
+# Function: getLogFileName
+# Arguments:
+#   - basename: Base name for the log file to identify corresponding application
+#   - logdir: Directory in which the log file is stored. Defaults to the current working directory.
+#   - extension: File extension of the log file. Defaults to ".log".
+# Description: Generates a filename for the log-file using the current date and a counter if another log file already exists.
+
+def getLogFileName(basename, logdir=os.getcwd(), extension=".log"):
+    filename = basename+"_"+time.strftime("%d-%m-%Y", time.localtime())
+    
+    if os.path.exists(os.path.join(logdir, filename+extension)):
+        filenamefree = False
+        i = 1
+        
+        while not filenamefree:
+            if os.path.exists(os.path.join(logdir, filename+"_"+str(i)+extension)):
+                i = i + 1
+            else:
+                filenamefree = True
+        
+        filename = os.path.join(logdir, filename+"_"+str(i)+extension)
+    else:
+        filename = os.path.join(logdir, filename+extension)
+    
+    return filename
+
+# Function: formatBytes(size)
+# Arguments:
+#   - size: Number of bytes
+# Description: Formats the given number of bytes as a human readable string (e.g. "1.5 GB").
+
+def formatBytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return "{0:.1f} {1}".format(size, unit) if unit != "B" else str(size)+" B"
+        size /= 1024
+    
+    return "{0:.1f} TB".format(size)
+
+# Function: formatDuration(seconds)
+# Arguments:
+#   - seconds: Duration in seconds
+# Description: Formats the given duration as "HH:MM:SS".
+
+def formatDuration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0:02d}:{1:02d}:{2:02d}".format(hours, minutes, seconds)
+
+# Function: getProfileString(profile)
+# Arguments:
+#   - profile: Encode profile
+# Description: Formats the codec, bitrate, cover settings and destination of a profile for the configuration output.
+
+def getProfileString(profile):
+    if profile.codec == "mp3" and profile.mode == "vbr":
+        rate = "V"+str(profile.quality)
+    else:
+        rate = profile.bitrate
+    
+    cover = "keep cover" if profile.embedsCovers() else "no cover"
+    if profile.embedsCovers() and profile.processesCovers():
+        cover = "cover "+("JPEG " if profile.convert_cover else "")+(str(profile.cover_size)+"px" if profile.cover_size > 0 else "")
+    
+    return "{0} ({1} {2} {3}, {4}{5}) -> {6}".format(profile.name, profile.codec.upper(), profile.mode.upper(), rate, cover.strip(), ", ReplayGain" if profile.replaygain else "", profile.destination)
+
+# Function: getPlanString(jobs, mirror=False, companions=False)
+# Arguments:
+#   - jobs: List of jobs created by 'Converter.plan'
+#   - mirror: If the moved files and orphaned files to delete should be listed. Defaults to False.
+#   - companions: If the cue sheets and folder art to copy should be listed. Defaults to False.
+# Description: Counts the source files and their bytes for every job type and returns the formatted plan. Files with jobs for several profiles are only counted once per job type.
+
+def getPlanString(jobs, mirror=False, companions=False):
+    sizes = {}
+    found = {}
+    
+    for job_type in job_outputs:
+        sizes[job_type] = {}
+    
+    for job in jobs:
+        sizes[job.type][job.source] = job.size
+        
+        if job.type != "delete":
+            found[job.source] = job.size
+    
+    plan = {job_type: [len(files), sum(files.values())] for job_type, files in sizes.items()}
+    planstring = plantext.format(len(found), formatBytes(sum(found.values())), plan["flac"][0], formatBytes(plan["flac"][1]), plan["mp3"][0], formatBytes(plan["mp3"][1]), plan["lrc"][0], formatBytes(plan["lrc"][1]), plan["exists"][0], formatBytes(plan["exists"][1]))
+    
+    if companions:
+        planstring += companionplantext.format(plan["cue"][0] + plan["art"][0], formatBytes(plan["cue"][1] + plan["art"][1]))
+    
+    if plan["gain"][0] > 0:
+        planstring += gainplantext.format(plan["gain"][0], formatBytes(plan["gain"][1]))
+    
+    if mirror:
+        planstring += mirrorplantext.format(plan["move"][0], formatBytes(plan["move"][1]), plan["delete"][0])
+    
+    return planstring
+
+# Function: getTimingString(statistics, slowest)
+# Arguments:
+#   - statistics: Statistics of all stages, as returned by 'getStageStatistics'
+#   - slowest: Records of the slowest jobs
+# Description: Formats the timing statistics for the output at the end of the run.
+
+def getTimingString(statistics, slowest):
+    lines = ["\nTIMINGS:"]
+    
+    for stage in sorted(statistics, key=lambda stage: (stage == "total", stage)):
+        values = statistics[stage]
+        lines.append(timingtext.format(stage, values["count"], values["total"], values["p50"], values["p95"], values["max"]))
+    
+    if len(slowest) > 0:
+        lines.append("  Slowest files:")
+    
+    for record in slowest:
+        stages = ", ".join("{0} {1:.3f}s".format(stage, seconds) for stage, seconds in sorted(record["stages"].items(), key=lambda item: -item[1]))
+        lines.append("    - {0:.3f}s {1} ({2})".format(record["time"], record["source"], stages))
+    
+    return "\n".join(lines)
+
+#Classes
+#--------
+
+# Class: ConsoleOutput
+# Description: Prints the results of a converter to the terminal and the log, counts them and shows the progress bar.
+
+class ConsoleOutput:
+
+    # Method: __init__(term, settings)
+    # Arguments:
+    #   - term: Terminal used for the output
+    #   - settings: Settings of the command line interface
+    # Description: Creates the output with empty counters. The progress bar is only shown on terminals. While it is shown or in quiet mode, only failures are printed for single files.
+
+    def __init__(self, term, settings):
+        self.term = term
+        self.settings = settings
+        self.counters = {
+            "copy_success": 0,
+            "copy_failure": 0,
+            "convert_success": 0,
+            "convert_failure": 0,
+            "lrc_copy_success": 0,
+            "lrc_copy_failure": 0,
+            "companion_copy_success": 0,
+            "companion_copy_failure": 0,
+            "exists": 0,
+            "claimed": 0,
+            "move_success": 0,
+            "move_failure": 0,
+            "gain_success": 0,
+            "gain_failure": 0,
+            "delete_success": 0,
+            "delete_failure": 0,
+            "broken": 0
+        }
+        self.progress = {
+            "enabled": settings["show_progress"] and term.is_a_tty,
+            "total_files": 0,
+            "total_bytes": 0,
+            "done_files": 0,
+            "done_bytes": 0,
+            "starttime": 0,
+            "last_draw": 0
+        }
+        self.print_files = not (self.progress["enabled"] or settings["quiet"])
+        self.lines = []
+        
+        #Timings, sizes and exit codes of all executed jobs
+        self.report_records = []
+        #Source files of all results, which are counted once, even if they have jobs for several profiles
+        self.sources = set()
+
+    # Method: startProgress(jobs)
+    # Arguments:
+    #   - jobs: List of jobs, which are about to be executed
+    # Description: Sets the totals of the progress bar and starts measuring the throughput.
+
+    def startProgress(self, jobs):
+        self.progress["total_files"] = sum(1 for job in jobs if job.type != "exists")
+        self.progress["total_bytes"] = sum(job.size for job in jobs if job.type != "exists")
+        self.progress["starttime"] = time.time()
+
+    # Method: write(line)
+    # Arguments:
+    #   - line: Line, which should be printed
+    # Description: Adds a line to the output, which is written the next time the progress bar is drawn.
+
+    def write(self, line):
+        self.lines.append(line)
+        
+        if len(self.lines) >= 1000:
+            self.flushOutput()
+
+    # Method: flushOutput()
+    # Description: Writes all collected lines to the terminal with a single write, in place of the progress bar.
+
+    def flushOutput(self):
+        if len(self.lines) == 0:
+            return
+        
+        text = "\n".join(self.lines)+"\n"
+        self.lines = []
+        
+        if self.progress["enabled"]:
+            text = self.term.move_x(0)+self.term.clear_eol+text
+        
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    # Method: drawProgress(force=False)
+    # Arguments:
+    #   - force: If the output should be written, even if it was written less than 0.2 seconds ago. Defaults to False.
+    # Description: Writes the collected lines and draws the progress bar including the number of processed files, the throughput and the estimated remaining time in the last line of the terminal.
+
+    def drawProgress(self, force=False):
+        progress = self.progress
+        now = time.time()
+        
+        if not force and now - progress["last_draw"] < 0.2:
+            return
+        
+        progress["last_draw"] = now
+        self.flushOutput()
+        
+        if not progress["enabled"]:
+            return
+        
+        elapsed = max(now - progress["starttime"], 0.001)
+        
+        #The remaining time is estimated using the remaining bytes, as files of the same type can be very different in size
+        if progress["total_bytes"] > 0:
+            fraction = progress["done_bytes"] / progress["total_bytes"]
+        elif progress["total_files"] > 0:
+            fraction = progress["done_files"] / progress["total_files"]
+        else:
+            fraction = 1
+        
+        if progress["done_bytes"] > 0:
+            eta = formatDuration((progress["total_bytes"] - progress["done_bytes"]) * elapsed / progress["done_bytes"])
+        else:
+            eta = "--:--:--"
+        
+        line = progresstext.format("", progress["done_files"], progress["total_files"], progress["done_files"] / elapsed, progress["done_bytes"] / elapsed / 1048576, eta)
+        
+        #The bar gets the space, which is left in the line. Some terminals don't report their width.
+        width = self.term.width or 80
+        bar_width = max(10, min(30, width - len(line) - 1))
+        bar = "#" * int(fraction * bar_width) + "-" * (bar_width - int(fraction * bar_width))
+        line = progresstext.format(bar, progress["done_files"], progress["total_files"], progress["done_files"] / elapsed, progress["done_bytes"] / elapsed / 1048576, eta)
+        
+        print(self.term.move_x(0)+self.term.clear_eol+line[:width - 1], end="", flush=True)
+
+    # Method: finishProgress()
+    # Description: Draws the final state of the progress bar and moves to the next line.
+
+    def finishProgress(self):
+        self.drawProgress(True)
+        
+        if self.progress["enabled"]:
+            print()
+
+    # Method: handleResult(result)
+    # Arguments:
+    #   - result: Result of a finished job
+    # Description: Outputs the result of a job to the terminal and the log and updates the counters. Failures are written immediately, all other lines when the progress bar is drawn the next time.
+
+    def handleResult(self, result):
+        term = self.term
+        job = result.job
+        label, color_name, counter = job_outputs[job.type]
+        
+        if job.type != "delete":
+            self.sources.add(job.source)
+        color = getattr(term, color_name)
+        
+        if job.type == "exists":
+            if self.print_files:
+                self.write("{0}[EXISTS] {term.bright_blue}{1}".format(color, job.destination, term=term))
+            logging.info("EXISTS: "+job.destination, extra={"event": "result", "type": label, "source": job.source, "destination": job.destination, "status": result.status})
+            self.counters[counter] += 1
+            return
+        
+        #Files processed by other converters are no longer part of the progress
+        if job.type == "claimed":
+            if self.print_files:
+                self.write("{0}[CLAIMED] {term.bright_blue}{1}".format(color, job.source, term=term))
+            logging.info("CLAIMED: "+job.source, extra={"event": "result", "type": label, "source": job.source, "destination": job.destination, "status": result.status})
+            self.counters[counter] += 1
+            self.progress["total_files"] -= 1
+            self.progress["total_bytes"] -= job.size
+            return
+        
+        #Broken files found by the verification weren't part of the planned progress
+        if job.verify_error != "":
+            self.write(term.yellow("[BROKEN] "+job.destination+": "+job.verify_error))
+            logging.warning("BROKEN: "+job.destination+": "+job.verify_error, extra={"event": "broken", "destination": job.destination, "error": job.verify_error})
+            self.counters["broken"] += 1
+            self.progress["total_files"] += 1
+            self.progress["total_bytes"] += job.size
+        
+        line = "{0}[{1}] {term.bright_blue}{2} {term.normal}-> {term.bright_cyan}{3}{term.normal}... ".format(color, label, job.source, job.destination, term=term)
+        self.progress["done_files"] += 1
+        self.progress["done_bytes"] += job.size
+        
+        if self.settings["report_file"] != "":
+            self.report_records.append(createReportRecord(result))
+        
+        fields = {"event": "result", "type": label, "source": job.source, "destination": job.destination, "status": result.status, "error": result.error, "seconds": round(job.time, 3)}
+        
+        if result.success:
+            if self.print_files:
+                self.write(line+term.green(result.status))
+            logging.info(label+" - SUCCESS: "+job.source+" -> "+job.destination, extra=fields)
+            self.counters[counter+"_success"] += 1
+        else:
+            self.write(line+term.red(result.status))
+            logging.warning(label+" - FAIL: "+job.source+" -> "+job.destination, extra=fields)
+            if result.error != "":
+                self.write(term.red("[ERROR] "+result.error))
+                logging.error(result.error)
+            self.counters[counter+"_failure"] += 1
+            self.drawProgress(True)
+
+    # Method: run(converter, jobs)
+    # Arguments:
+    #   - converter: Opened converter
+    #   - jobs: List of jobs, which should be executed
+    # Description: Coroutine executing the jobs using the converter and handling every result as soon as it is available. The progress bar is also redrawn while no job finishes.
+
+    async def run(self, converter, jobs):
+        self.startProgress(jobs)
+
+        async def redrawProgress():
+            while True:
+                await asyncio.sleep(0.5)
+                self.drawProgress()
+        
+        redraw_task = asyncio.ensure_future(redrawProgress())
+        
+        try:
+            async for result in converter.iterResults(jobs):
+                self.handleResult(result)
+                self.drawProgress()
+        finally:
+            redraw_task.cancel()
+        
+        self.finishProgress()
+
+    # Method: watch(watcher)
+    # Arguments:
+    #   - watcher: Started library watcher
+    # Description: Coroutine handling the results of the jobs executed by the watcher, until it is cancelled. Every file is printed as soon as it was processed, as there is no progress bar.
+
+    async def watch(self, watcher):
+        self.progress["enabled"] = False
+        self.print_files = not self.settings["quiet"]
+        
+        async for result in watcher.iterResults():
+            self.handleResult(result)
+            self.flushOutput()
+
+# Function: main(argument_list=None)
+# Arguments:
+#   - argument_list: Arguments passed to the program, without the program name. Defaults to None, in which case 'sys.argv' is used.
+# Description: Runs the whole conversion from the command line.
+
+def main(argument_list=None):
+    if argument_list is None:
+        argument_list = sys.argv[1:]
+    
+    #Setup Code
+    #-----------
+    
+    #Init Colorama
+    colorama.init()
+    
+    #Init Blessings
+    term = Terminal()
+    
+    print("{term.green}Music Library Converter {term.normal}by {term.cyan}JoeJoeTV{term.normal}\n".format(term=term))
+    
+    #Check for dependencies
+    try:
+        result_check_ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=False)
+        ffmpeg_found = result_check_ffmpeg.returncode == 0
+    except OSError:
+        ffmpeg_found = False
+    if not ffmpeg_found:
+        print(term.red("[ERROR] Missing dependency 'ffmpeg'! Please install it from https://ffmpeg.org."))
+    
+    #Check Parameters
+    settings = dict(default_settings)
+    settings.update(cli_settings)
+    sourcepath, destpath = checkParameters(argument_list, settings)
+    
+    try:
+        converter = Converter(sourcepath, destpath, settings)
+    except ValueError as err:
+        print("[ERROR] "+str(err)+"!")
+        sys.exit(2)
+    
+    #Setup Logging
+    if settings["generate_logfile"]:
+        log_listener = startLogging(getLogFileName("cml", extension=".jsonl" if settings["log_format"] == "json" else ".log"), settings["log_format"])
+    else:
+        log_listener = startLogging(None)
+    
+    logging.info("Music Library Converter by JoeJoeTV")
+    
+    configstring = configurationtext.format(sourcepath, destpath, str(settings["generate_logfile"]), str(settings["convert_cover"]), str(settings["scale_cover"])+"("+str(settings["cover_scale"])+")", str(settings["copy_lyrics"]), str(settings["jobs"]), str(settings["use_manifest"]), settings["cover_cache_dir"] or "None", settings["copy_mode"], "".join("\n    - "+getProfileString(profile) for profile in converter.profiles), str(settings["mirror"])+(" (delete orphans)" if settings["delete_orphans"] else ""), str(settings["verify"])+(" (decode)" if settings["verify_decode"] else ""), str(settings["copy_cue"]), str(settings["copy_folder_art"]), str(settings["shard_index"])+"/"+str(settings["shard_count"]), settings["claim_dir"] or "None")
+    if not settings["quiet"]:
+        print(configstring)
+    for s in configstring.split("\n"):
+        logging.info(s)
+    
+    #Get Starting Time
+    starttime = time.time()
+    
+    #Main Code
+    #----------
+    
+    output = ConsoleOutput(term, settings)
+    
+    #Load the state of previous runs
+    with converter:
+        #Files added while the library is converted are picked up by the watcher
+        if settings["watch"] and not settings["dry_run"]:
+            watcher = LibraryWatcher(converter, settings["settle_time"], settings["watch_poll"])
+            watcher.start()
+        
+        #Scan the whole library first
+        jobs = converter.plan()
+        
+        planstring = getPlanString(jobs, settings["mirror"], settings["copy_cue"] or settings["copy_folder_art"])
+        if not settings["quiet"] or settings["dry_run"]:
+            print(planstring)
+        for s in planstring.split("\n"):
+            logging.info(s)
+        
+        if settings["dry_run"]:
+            stopLogging(log_listener)
+            sys.exit(0)
+        
+        #Execute the jobs simultaneously, showing a progress bar on terminals
+        asyncio.run(output.run(converter, jobs))
+        
+        if settings["watch"]:
+            watchstring = "\nWatching "+sourcepath+(" (polling every "+str(watcher.watcher.interval)+"s)" if watcher.isPolling() else "")+" for new files. Press Ctrl+C to stop."
+            print(term.green(watchstring))
+            logging.info(watchstring.strip())
+            
+            try:
+                asyncio.run(output.watch(watcher))
+            except KeyboardInterrupt:
+                logging.info("Stopped watching")
+            finally:
+                watcher.close()
+    
+    #Get elapsed Time
+    endtime = time.time()
+    timetaken = endtime - starttime
+    
+    print(term.green("\nDONE in "+str(timetaken)+" seconds!"))
+    logging.info("")
+    logging.info("DONE in "+str(timetaken)+" seconds!")
+    
+    summarystring = summarytext.format(len(output.sources), output.counters["convert_success"], output.counters["convert_failure"], output.counters["copy_success"], output.counters["copy_failure"], output.counters["exists"], output.counters["lrc_copy_success"], output.counters["lrc_copy_failure"], profilestext.format(len(converter.profiles)) if len(converter.profiles) > 1 else "")
+    
+    if any(profile.processesCovers() for profile in converter.profiles):
+        cover_cache_counters = converter.cover_cache.counters
+        summarystring += "\n"+covercachetext.format(cover_cache_counters["hits"], cover_cache_counters["disk_hits"], cover_cache_counters["misses"])
+    
+    if settings["copy_cue"] or settings["copy_folder_art"]:
+        summarystring += "\n"+companiontext.format(output.counters["companion_copy_success"], output.counters["companion_copy_failure"])
+    
+    if settings["verify"]:
+        summarystring += "\n"+verifytext.format(output.counters["broken"])
+    
+    if output.counters["gain_success"] + output.counters["gain_failure"] > 0:
+        summarystring += "\n"+gaintext.format(output.counters["gain_success"], output.counters["gain_failure"])
+    
+    if settings["claim_dir"] != "":
+        summarystring += "\n"+claimtext.format(output.counters["claimed"])
+    
+    if settings["mirror"]:
+        summarystring += "\n"+mirrortext.format(output.counters["move_success"], output.counters["move_failure"], output.counters["delete_success"], output.counters["delete_failure"])
+    
+    print(term.bold_bright_green(summarystring))
+    for s in summarystring.split("\n"):
+        logging.info(s)
+    
+    #Write the run report
+    if settings["report_file"] != "":
+        statistics = getStageStatistics(output.report_records)
+        slowest = getSlowestRecords(output.report_records, settings["report_slowest"])
+        
+        timingstring = getTimingString(statistics, slowest)
+        if not settings["quiet"]:
+            print(timingstring)
+        for s in timingstring.split("\n"):
+            logging.info(s)
+        
+        writeReport(settings["report_file"], output.report_records, {
+            "version": version,
+            "source": sourcepath,
+            "destination": destpath,
+            "jobs": settings["jobs"],
+            "time": timetaken,
+            "counters": output.counters,
+            "stages": statistics,
+            "slowest": slowest
+        })
+        print(term.green("\nReport written to "+settings["report_file"]))
+    
+    stopLogging(log_listener)
@@ -0,0 +1,1140 @@
+# coding: utf8
+
+# Music Library Converter - Converter
+# by JoeJoeTV - 2020,2021
+# Executes conversion jobs concurrently from a single asyncio event loop
+
+
+import os
+import time
+import shutil
+import struct
+import zlib
+import asyncio
+import functools
+import logging
+import concurrent.futures
+from PIL import Image
+
+from .jobs import ConversionJob, JobResult, timeStage, job_types
+from .metadata import readAudioFileMetadata, rewriteID3Cover
+from .covers import CoverCache, coverNeedsRework
+from .files import copyFile, moveFile, removeEmptyDirectories, getTemporaryPath, commitOutput, discardOutput, removeStaleTemporaryFiles, readFile, writeFile, rewriteCueSheet
+from .manifest import Manifest, manifest_filename, hashFile, fingerprintFile
+from .planner import planLibrary, prepareJob, getDestinationPath, indexDirectory, detectMoves
+from .profiles import resolveProfiles
+from .executor import runProcess, boundedResults, PipeInput, pipe_inputs_supported
+from .verify import checkOutput
+from .workers import WorkClaims, getShard
+from .loudness import loudness_arguments, loudness_log_arguments, parseLoudness, getAlbumLoudness, getGainTags, getGainArguments, writeID3Gain
+
+#Variables and Constants
+#------------------------
+
+logger = logging.getLogger(__name__)
+
+default_settings = {
+    "copy_lyrics": False,
+    "copy_cue": False,
+    "copy_folder_art": False,
+    "scale_cover": False,
+    "cover_scale": 0,
+    "convert_cover": False,
+    "jobs": os.cpu_count() or 1,
+    "bitrate": "320k",
+    "use_manifest": True,
+    "hash_sources": False,
+    "cover_cache_dir": "",
+    "cover_cache_memory": 67108864,
+    "copy_mode": "auto",
+    "dry_run": False,
+    "mirror": False,
+    "delete_orphans": False,
+    "verify": False,
+    "verify_decode": False,
+    "shard_index": 1,
+    "shard_count": 1,
+    "claim_dir": "",
+    "lease_timeout": 120,
+    "replaygain": False,
+    "profiles": []
+}
+copy_modes = ("auto", "hardlink", "copy")
+#Job types, whose output is written to a temporary file first
+output_types = ("mp3", "flac", "lrc", "cue", "art")
+
+#Classes
+#--------
+
+# Class: Converter
+# Description: Converts or copies the files of a source library into one destination library per encode profile. Jobs are planned using 'plan' or 'createJobs' and executed using 'convert', 'convertAsync' or 'iterResults', which return a 'JobResult' for every job.
+
+class Converter:
+
+    # Method: __init__(source_path, dest_path, settings=None, **options)
+    # Arguments:
+    #   - source_path: Path of the source library
+    #   - dest_path: Path of the destination library, which is used by the default profile and by all profiles without destination
+    #   - settings: Dictionary of settings overriding the ones in 'default_settings'. Defaults to None.
+    #   - options: Single settings overriding the ones in 'settings' (e.g. 'jobs=4')
+    # Description: Creates the converter using 'default_settings' updated by 'settings' and 'options'. Raises ValueError for invalid settings.
+
+    def __init__(self, source_path, dest_path, settings=None, **options):
+        self.source_path = os.path.abspath(source_path)
+        self.dest_path = os.path.abspath(dest_path)
+        self.settings = dict(default_settings)
+        self.settings.update(settings or {})
+        self.settings.update(options)
+        
+        if self.settings["copy_mode"] not in copy_modes:
+            raise ValueError("Invalid copy mode: "+str(self.settings["copy_mode"]))
+        
+        if self.settings["delete_orphans"]:
+            self.settings["mirror"] = True
+        
+        if self.settings["verify_decode"]:
+            self.settings["verify"] = True
+        
+        if self.settings["mirror"] and not self.settings["use_manifest"]:
+            raise ValueError("Mirror mode needs the manifest")
+        
+        if not 1 <= self.settings["shard_index"] <= self.settings["shard_count"]:
+            raise ValueError("Invalid shard: "+str(self.settings["shard_index"])+"/"+str(self.settings["shard_count"]))
+        
+        self.profiles = resolveProfiles(self.settings, self.dest_path)
+        self.cover_cache = CoverCache(self.settings)
+        self.manifests = {}
+        self.work_claims = None
+        self.swept_directories = set()
+        self.thread_pool = None
+        self.semaphore = None
+        self.semaphore_loop = None
+        self.group_functions = {
+            "mp3": self.copyMP3Files,
+            "flac": self.convertFLACFiles,
+            "lrc": self.copyLRCFiles,
+            "cue": self.copyCueFiles,
+            "art": self.convertFolderArt,
+            "move": self.moveFiles,
+            "gain": self.tagFiles,
+            "delete": self.deleteFiles
+        }
+
+    # Method: open()
+    # Description: Opens the manifest of every destination library, if 'use_manifest' is set, and the claim directory, if 'claim_dir' is set. During a dry run, manifests are only opened if they already exist and the claim directory isn't used.
+
+    def open(self):
+        if self.settings["claim_dir"] != "" and not self.settings["dry_run"] and self.work_claims is None:
+            self.work_claims = WorkClaims(self.settings["claim_dir"], self.settings["lease_timeout"])
+        
+        if not self.settings["use_manifest"]:
+            return
+        
+        #Converters sharing the work also share the manifests
+        batch_size = 1 if self.isShared() else 100
+        
+        for profile in self.profiles:
+            if profile.name in self.manifests:
+                continue
+            
+            if self.settings["dry_run"]:
+                if os.path.exists(os.path.join(profile.destination, manifest_filename)):
+                    self.manifests[profile.name] = Manifest(profile.destination, batch_size)
+            else:
+                os.makedirs(profile.destination, exist_ok=True)
+                self.manifests[profile.name] = Manifest(profile.destination, batch_size)
+
+    # Method: isShared()
+    # Description: Checks if this converter shares the work with other converters, either by using shards or a claim directory.
+
+    def isShared(self):
+        return self.settings["shard_count"] > 1 or self.settings["claim_dir"] != ""
+
+    # Method: close()
+    # Description: Writes all pending changes to the manifests and stops the thread pool.
+
+    def close(self):
+        for manifest in self.manifests.values():
+            manifest.close()
+        self.manifests = {}
+        
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown()
+            self.thread_pool = None
+
+    # Methods: __enter__(), __exit__(...), __aenter__(), __aexit__(...)
+    # Description: Opens the converter at the start of a 'with' or 'async with' block and closes it at the end.
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Method: plan()
+    # Description: Scans the source library and returns the list of jobs for every file and profile, as described in 'planLibrary'. Only the files of the shard given by 'shard_index' are kept.
+
+    def plan(self):
+        jobs = planLibrary(self.source_path, self.profiles, self.settings, self.manifests)
+        
+        if self.settings["shard_count"] > 1:
+            jobs = [job for job in jobs if self.inShard(job)]
+        
+        return jobs
+
+    # Method: inShard(job)
+    # Arguments:
+    #   - job: Job of a file in the source library
+    # Description: Checks if the source file of the job belongs to the shard of this converter.
+
+    def inShard(self, job):
+        return getShard(os.path.relpath(job.source, self.source_path), self.settings["shard_count"]) == self.settings["shard_index"]
+
+    # Method: getRecordedDestinations()
+    # Description: Returns the source file recorded in the manifest for every destination by profile name.
+
+    def getRecordedDestinations(self):
+        return {profile.name: {os.path.join(profile.destination, entry["destination"]): key for key, entry in self.manifests[profile.name].entries.items()} for profile in self.profiles if profile.name in self.manifests}
+
+    # Method: isShadowed(job, claimed_destinations, recorded_destinations)
+    # Arguments:
+    #   - job: Job of a file in the source library
+    #   - claimed_destinations: Destinations of the jobs planned before in the same batch
+    #   - recorded_destinations: Destinations returned by 'getRecordedDestinations'
+    # Description: Checks if another source file has the same destination as the job (e.g. 'song.mp3' and 'song.flac'), either in the same batch or in the manifest, as long as it still exists.
+
+    def isShadowed(self, job, claimed_destinations, recorded_destinations):
+        if job.destination in claimed_destinations:
+            return True
+        
+        key = recorded_destinations.get(job.profile.name, {}).get(job.destination)
+        return key is not None and key != os.path.relpath(job.source, self.source_path) and os.path.exists(os.path.join(self.source_path, key))
+
+    # Method: createJobs(source, claimed_destinations=None, recorded_destinations=None)
+    # Arguments:
+    #   - source: Path of an audio file or a companion file (see 'job_types') inside of the source library
+    #   - claimed_destinations: Set of the destinations of the jobs planned before in the same batch, to which the destinations of the new jobs are added. Defaults to None.
+    #   - recorded_destinations: Destinations returned by 'getRecordedDestinations'. Defaults to None, in which case they are read from the manifests.
+    # Description: Creates the jobs of a single file for every profile like 'plan' does, marking jobs as shadowed, whose destination belongs to another source file. Returns an empty list for files of other shards and raises ValueError for unsupported file types.
+
+    def createJobs(self, source, claimed_destinations=None, recorded_destinations=None):
+        source = os.path.abspath(source)
+        relpath = os.path.relpath(source, self.source_path)
+        jobs = []
+        
+        if claimed_destinations is None:
+            claimed_destinations = set()
+        
+        if recorded_destinations is None:
+            recorded_destinations = self.getRecordedDestinations()
+        
+        for profile in self.profiles:
+            job = ConversionJob.fromPath(source, None, profile)
+            job.destination = getDestinationPath(relpath, job.type, profile)
+            
+            if not self.inShard(job):
+                return []
+            
+            jobs.append(job)
+            
+            if self.isShadowed(job, claimed_destinations, recorded_destinations):
+                job.type = "exists"
+                job.shadowed = True
+                continue
+            
+            claimed_destinations.add(job.destination)
+            prepareJob(job, self.source_path, self.settings, self.manifests.get(profile.name), {})
+        
+        return jobs
+
+    # Method: planChanges(sources, removed_sources=[])
+    # Arguments:
+    #   - sources: Paths of files inside of the source library, which were added or changed
+    #   - removed_sources: Paths of files and directories, which were removed from the source library. Defaults to [].
+    # Description: Returns the jobs for the changed and removed files like 'plan' does for the whole library, only indexing the directories of the changed files again.
+
+    def planChanges(self, sources, removed_sources=[]):
+        changed = set(os.path.abspath(source) for source in sources)
+        jobs = []
+        claimed_destinations = set()
+        recorded_destinations = self.getRecordedDestinations()
+        
+        for directory in sorted(set(os.path.dirname(source) for source in changed)):
+            try:
+                with os.scandir(directory) as entries:
+                    file_entries = sorted([entry for entry in entries if entry.is_file()], key=lambda entry: entry.name)
+            except OSError as err:
+                logger.warning("Could not scan directory "+directory+": "+str(err))
+                continue
+            
+            indexed = indexDirectory(file_entries, self.settings)
+            audio_changed = any(entry.path in changed for entry, file_type in indexed if file_type in ("mp3", "flac"))
+            
+            for entry, file_type in indexed:
+                if entry.path in changed or (audio_changed and file_type not in ("mp3", "flac")):
+                    #The file may have been removed in the meantime
+                    try:
+                        jobs += self.createJobs(entry.path, claimed_destinations, recorded_destinations)
+                    except OSError as err:
+                        logger.warning("Could not plan "+entry.path+": "+str(err))
+        
+        if self.settings["mirror"] and len(removed_sources) > 0:
+            removed_paths = [os.path.relpath(os.path.abspath(source), self.source_path) for source in removed_sources]
+            removed_keys = set()
+            
+            for manifest in self.manifests.values():
+                for key in manifest.entries:
+                    if any(key == path or key.startswith(path+os.sep) for path in removed_paths):
+                        removed_keys.add(key)
+            
+            new_jobs = [job for job in jobs if job.type != "exists" and job.manifest_key not in self.manifests[job.profile.name].entries]
+            delete_jobs = detectMoves(jobs, new_jobs, self.source_path, self.profiles, self.settings, self.manifests, claimed_destinations, removed_keys)
+            jobs += [job for job in delete_jobs if self.inShard(job)]
+        
+        return jobs
+
+    # Method: groupJobs(jobs)
+    # Arguments:
+    #   - jobs: Iterable of jobs, in which the jobs of the same source file follow each other
+    # Description: Yields lists of the jobs belonging to the same source file, so the file only has to be read, hashed and decoded once for all profiles.
+
+    def groupJobs(self, jobs):
+        group = []
+        
+        for job in jobs:
+            if len(group) > 0 and job.source != group[0].source:
+                yield group
+                group = []
+            
+            group.append(job)
+        
+        if len(group) > 0:
+            yield group
+
+    # Method: runBlocking(function, *arguments)
+    # Arguments:
+    #   - function: Function, which blocks while it is executed (e.g. file access or Pillow)
+    #   - arguments: Arguments passed to 'function'
+    # Description: Coroutine executing the function in the thread pool of the converter, so the event loop can continue with other jobs.
+
+    async def runBlocking(self, function, *arguments):
+        if self.thread_pool is None:
+            self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.settings["jobs"])
+        
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool, functools.partial(function, *arguments))
+
+    # Method: getSemaphore()
+    # Description: Returns the semaphore limiting the number of simultaneously processed source files to 'jobs'. A new one is created for every event loop.
+
+    def getSemaphore(self):
+        loop = asyncio.get_running_loop()
+        
+        if self.semaphore is None or self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.settings["jobs"])
+            self.semaphore_loop = loop
+        
+        return self.semaphore
+
+    # Method: readCover(jobs)
+    # Arguments:
+    #   - jobs: Jobs of the same audio file
+    # Description: Coroutine reading the embedded cover of the source file into memory once for all jobs. Returns the cover as returned by 'readAudioFileMetadata' and an error message, which is empty if no problem occured.
+
+    async def readCover(self, jobs):
+        try:
+            with timeStage(jobs[0], "probe"):
+                cover = (await self.runBlocking(readAudioFileMetadata, jobs[0].source))["cover"]
+        except (OSError, ValueError, IndexError, struct.error, zlib.error):
+            return None, "There was a problem while extracting the cover!"
+        
+        if cover is not None:
+            for job in jobs:
+                job.cover_bytes = len(cover["data"])
+        
+        return cover, ""
+
+    # Method: processCover(job, cover)
+    # Arguments:
+    #   - job: Job, whose source file is an audio file
+    #   - cover: Cover read by 'readCover' or None
+    # Description: Coroutine converting the cover according to the profile of the job. Returns the content of the new cover and an error message, which is empty if no problem occured. The new cover is None if there is no cover or if the cover can be kept as it is.
+
+    async def processCover(self, job, cover):
+        #Only continue the process if there is a cover, which has to be changed
+        if cover is None or not coverNeedsRework(cover, job.profile.convert_cover, job.profile.cover_size):
+            return None, ""
+        
+        try:
+            with timeStage(job, "cover"):
+                return await self.runBlocking(self.cover_cache.convert, cover["data"], job.profile.convert_cover, job.profile.cover_size), ""
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None, "There was a problem while converting the cover!"
+
+    # Method: copyMP3Files(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "mp3" of the same source file
+    # Description: Coroutine copying the MP3 file into the destination of every job. The cover is only read once.
+
+    async def copyMP3Files(self, jobs):
+        cover = None
+        loudness = None
+        
+        if any(job.profile.processesCovers() for job in jobs):
+            cover, error = await self.readCover(jobs)
+            
+            if error != "":
+                return [JobResult(job, False, "FAIL", error) for job in jobs]
+        
+        #The file is only decoded once for all profiles
+        if any(job.profile.replaygain for job in jobs):
+            with timeStage(jobs[0], "loudness"):
+                loudness = await self.measureLoudness(jobs[0].source)
+            
+            if loudness is None:
+                return [JobResult(job, False, "FAIL", "Could not measure the loudness!") for job in jobs]
+        
+        results = []
+        
+        for job in jobs:
+            try:
+                result = await self.copyMP3File(job, cover)
+                
+                if result.success and job.profile.replaygain:
+                    result = await self.writeTrackGain(result, loudness)
+                
+                results.append(result)
+            except Exception as err:
+                results.append(JobResult(job, False, "FAIL", str(err)))
+        
+        return results
+
+    # Method: copyMP3File(job, cover)
+    # Arguments:
+    #   - job: Job of type "mp3"
+    #   - cover: Cover read by 'readCover' or None
+    # Description: Coroutine copying the MP3 file of the job to the temporary path of its destination and replacing the cover, if the profile of the job converts or scales covers.
+
+    async def copyMP3File(self, job, cover):
+        originalfilepath = job.source
+        newfilepath = getTemporaryPath(job.destination)
+        
+        #If the profile converts or scales covers...
+        if job.profile.processesCovers():
+            cover_data, error = await self.processCover(job, cover)
+            
+            if error != "":
+                return JobResult(job, False, "FAIL", error)
+            elif cover_data is not None:
+                #Write a new tag containing the cover and copy the audio data as it is
+                with timeStage(job, "copy"):
+                    rewritten = await self.runBlocking(rewriteID3Cover, originalfilepath, newfilepath, cover_data)
+                
+                if rewritten:
+                    return JobResult(job, True, "SUCCESS (CONVERT)")
+                
+                #Re-insert cover into audio file using ffmpeg, which reads the new cover from its standard input
+                with timeStage(job, "ffmpeg"):
+                    result_replace_cover = await runProcess(["ffmpeg", "-hide_banner", "-loglevel", "quiet", "-i", originalfilepath, "-f", "image2pipe", "-i", "pipe:0", "-c", "copy", "-map", "0:a", "-map", "1:v", "-y", newfilepath], cover_data)
+                job.exit_code = result_replace_cover.returncode
+                
+                if result_replace_cover.returncode == 0:
+                    return JobResult(job, True, "SUCCESS (CONVERT)")
+                else:
+                    return JobResult(job, False, "FAIL", "There was a problem while replacing the cover!")
+        
+        #Files without a cover (or with a cover, which can be kept) are copied as they are
+        with timeStage(job, "copy"):
+            await self.runBlocking(copyFile, originalfilepath, newfilepath, self.settings["copy_mode"])
+        
+        if os.path.exists(newfilepath):
+            return JobResult(job, True, "SUCCESS (COPY ONLY)")
+        else:
+            return JobResult(job, False, "FAIL")
+
+    # Method: convertFLACFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "flac" of the same source file
+    # Description: Coroutine converting the FLAC file for every job, decoding it only once for all profiles and converting every distinct cover only once.
+
+    async def convertFLACFiles(self, jobs):
+        cover = None
+        
+        if any(job.profile.embedsCovers() and job.profile.processesCovers() for job in jobs):
+            cover, error = await self.readCover(jobs)
+            
+            if error != "":
+                return [JobResult(job, False, "FAIL", error) for job in jobs]
+        
+        outputs = []
+        
+        for job in jobs:
+            cover_data = None
+            
+            if job.profile.embedsCovers() and job.profile.processesCovers():
+                cover_data, error = await self.processCover(job, cover)
+                
+                if error != "":
+                    return [JobResult(job, False, "FAIL", error) for job in jobs]
+            
+            outputs.append((job, cover_data))
+        
+        if pipe_inputs_supported:
+            batches = [outputs]
+        else:
+            batches = {}
+            
+            for job, cover_data in outputs:
+                batches.setdefault(cover_data, []).append((job, cover_data))
+            
+            batches = list(batches.values())
+        
+        results = []
+        
+        for batch in batches:
+            results += await self.encodeFLACFile(batch)
+        
+        return results
+
+    # Method: encodeFLACFile(outputs)
+    # Arguments:
+    #   - outputs: List of jobs of the same FLAC file and their new covers (or None)
+    # Description: Coroutine running a single ffmpeg process, which decodes the FLAC file once and encodes it for every job according to its profile into the temporary path of its destination. The first distinct cover is read from the standard input, all others from additional pipes.
+
+    async def encodeFLACFile(self, outputs):
+        measure_loudness = any(job.profile.replaygain for job, cover_data in outputs)
+        arguments = ["ffmpeg", "-hide_banner"] + (loudness_log_arguments if measure_loudness else ["-loglevel", "quiet"]) + ["-i", outputs[0][0].source]
+        cover_inputs = []
+        input_data = None
+        
+        for job, cover_data in outputs:
+            if cover_data is not None and cover_data not in cover_inputs:
+                cover_inputs.append(cover_data)
+        
+        for cover_data in cover_inputs:
+            if input_data is None:
+                arguments += ["-f", "image2pipe", "-i", "pipe:0"]
+                input_data = cover_data
+            else:
+                arguments += ["-f", "image2pipe", "-i", PipeInput(cover_data)]
+        
+        for job, cover_data in outputs:
+            if cover_data is not None:
+                arguments += ["-map", "0:a", "-map", str(cover_inputs.index(cover_data) + 1)+":v", "-c:v", "copy"]
+            elif not job.profile.embedsCovers():
+                arguments += ["-map", "0:a"]
+            elif len(cover_inputs) > 0:
+                #Keep the embedded cover, without picking up the new cover of another output
+                arguments += ["-map", "0:a", "-map", "0:v:0?", "-c:v", "copy"]
+            else:
+                arguments += ["-c:v", "copy"]
+            
+            arguments += job.profile.getEncoderArguments() + ["-map_metadata", "0"] + job.profile.getMuxerArguments() + ["-y", getTemporaryPath(job.destination)]
+        
+        #The loudness is measured from the same decoded audio using an additional output
+        if measure_loudness:
+            arguments += loudness_arguments
+        
+        with timeStage(outputs[0][0], "ffmpeg"):
+            result_convert_file = await runProcess(arguments, input_data)
+        
+        loudness = None
+        
+        if measure_loudness and result_convert_file.returncode == 0:
+            loudness = parseLoudness(result_convert_file.stdout, result_convert_file.stderr)
+        
+        results = []
+        
+        for job, cover_data in outputs:
+            job.exit_code = result_convert_file.returncode
+            
+            if result_convert_file.returncode != 0:
+                results.append(JobResult(job, False, "FAIL", "There was an error during the conversion process!"))
+                continue
+            elif cover_data is not None:
+                result = JobResult(job, True, "SUCCESS (CONVERT)")
+            else:
+                result = JobResult(job, True, "SUCCESS (TO "+job.profile.codec.upper()+" ONLY)")
+            
+            if job.profile.replaygain:
+                result = await self.writeTrackGain(result, loudness)
+            
+            results.append(result)
+        
+        return results
+
+    # Method: measureLoudness(source)
+    # Arguments:
+    #   - source: Path of an audio file
+    # Description: Coroutine decoding the file with ffmpeg and returning its loudness, as returned by 'parseLoudness', or None if it couldn't be measured.
+
+    async def measureLoudness(self, source):
+        result_measure = await runProcess(["ffmpeg", "-hide_banner"] + loudness_log_arguments + ["-i", source] + loudness_arguments)
+        
+        if result_measure.returncode != 0:
+            return None
+        
+        return parseLoudness(result_measure.stdout, result_measure.stderr)
+
+    # Method: writeGain(path, track, album=None)
+    # Arguments:
+    #   - path: Path of a converted or copied file
+    #   - track: Loudness of the track
+    #   - album: Loudness of the album or None, if only the track gain should be written. Defaults to None.
+    # Description: Coroutine writing the ReplayGain tags returned by 'getGainTags' into the file using a temporary path only used by this converter. Returns False if the tags couldn't be written.
+
+    async def writeGain(self, path, track, album=None):
+        tags = getGainTags(path, track, album)
+        
+        if os.path.splitext(path)[1].lower() == ".mp3":
+            if await self.runBlocking(writeID3Gain, path, tags):
+                return True
+        
+        result_tag = await runProcess(["ffmpeg", "-hide_banner", "-loglevel", "quiet", "-i", path] + getGainArguments(path, tags) + ["-y", getTemporaryPath(path, True)])
+        
+        if result_tag.returncode != 0:
+            await self.runBlocking(discardOutput, path, True)
+            return False
+        
+        await self.runBlocking(commitOutput, path, True)
+        return True
+
+    # Method: writeTrackGain(result, loudness)
+    # Arguments:
+    #   - result: Successful result of a job, whose profile writes ReplayGain tags
+    #   - loudness: Loudness of the source file or None, if it couldn't be measured
+    # Description: Coroutine storing the loudness in the job and writing the track gain into the temporary path of its destination. Returns the result or a failed result, if the loudness is missing or the tags couldn't be written.
+
+    async def writeTrackGain(self, result, loudness):
+        job = result.job
+        job.loudness = loudness
+        
+        if loudness is None:
+            return JobResult(job, False, "FAIL", "Could not measure the loudness!")
+        
+        with timeStage(job, "replaygain"):
+            tagged = await self.writeGain(getTemporaryPath(job.destination), loudness)
+        
+        if not tagged:
+            return JobResult(job, False, "FAIL", "Could not write the ReplayGain tags!")
+        
+        return result
+
+    # Method: tagFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "gain" of the same source file
+    # Description: Coroutine measuring the loudness of the source file once and writing the track gain into the existing output of every job.
+
+    async def tagFiles(self, jobs):
+        with timeStage(jobs[0], "loudness"):
+            loudness = await self.measureLoudness(jobs[0].source)
+        
+        if loudness is None:
+            return [JobResult(job, False, "FAIL", "Could not measure the loudness!") for job in jobs]
+        
+        results = []
+        
+        for job in jobs:
+            job.loudness = loudness
+            
+            try:
+                with timeStage(job, "replaygain"):
+                    tagged = await self.writeGain(job.destination, loudness)
+            except Exception as err:
+                results.append(JobResult(job, False, "FAIL", str(err)))
+                continue
+            
+            if tagged:
+                results.append(JobResult(job, True, "SUCCESS (REPLAYGAIN)"))
+            else:
+                results.append(JobResult(job, False, "FAIL", "Could not write the ReplayGain tags!"))
+        
+        return results
+
+    # Method: copyLRCFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "lrc" of the same source file
+    # Description: Coroutine copying the LRC file to the temporary path of the destination of every job.
+
+    async def copyLRCFiles(self, jobs):
+        results = []
+        
+        for job in jobs:
+            temporary_path = getTemporaryPath(job.destination)
+            
+            with timeStage(job, "lrc"):
+                result_copy = await self.runBlocking(shutil.copyfile, job.source, temporary_path)
+            
+            if os.path.exists(temporary_path) and os.path.samefile(temporary_path, result_copy):
+                results.append(JobResult(job, True, "SUCCESS"))
+            else:
+                results.append(JobResult(job, False, "FAIL"))
+        
+        return results
+
+    # Method: copyCueFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "cue" of the same source file
+    # Description: Coroutine copying the cue sheet to the temporary path of the destination of every job, changing references to FLAC files to the file extension of the profile.
+
+    async def copyCueFiles(self, jobs):
+        results = []
+        
+        for job in jobs:
+            with timeStage(job, "copy"):
+                await self.runBlocking(rewriteCueSheet, job.source, getTemporaryPath(job.destination), job.profile.getExtension())
+            
+            results.append(JobResult(job, True, "SUCCESS"))
+        
+        return results
+
+    # Method: convertFolderArt(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "art" of the same source file
+    # Description: Coroutine converting and scaling the folder art image according to the cover settings of every profile, like embedded covers are. Images, which don't have to be changed, are copied as they are.
+
+    async def convertFolderArt(self, jobs):
+        image_data = None
+        results = []
+        
+        for job in jobs:
+            if job.profile.processesCovers():
+                if image_data is None:
+                    with timeStage(job, "probe"):
+                        image_data = await self.runBlocking(readFile, job.source)
+                    
+                    for other_job in jobs:
+                        other_job.cover_bytes = len(image_data)
+                
+                try:
+                    with timeStage(job, "cover"):
+                        new_image_data = await self.runBlocking(self.cover_cache.convert, image_data, job.profile.convert_cover, job.profile.cover_size)
+                except (OSError, ValueError, Image.DecompressionBombError):
+                    results.append(JobResult(job, False, "FAIL", "There was a problem while converting the image!"))
+                    continue
+                
+                with timeStage(job, "copy"):
+                    await self.runBlocking(writeFile, getTemporaryPath(job.destination), new_image_data)
+                
+                results.append(JobResult(job, True, "SUCCESS (CONVERT)" if new_image_data != image_data else "SUCCESS (COPY ONLY)"))
+            else:
+                with timeStage(job, "copy"):
+                    await self.runBlocking(copyFile, job.source, getTemporaryPath(job.destination), self.settings["copy_mode"])
+                
+                results.append(JobResult(job, True, "SUCCESS (COPY ONLY)"))
+        
+        return results
+
+    # Method: moveFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "move" of the same source file
+    # Description: Coroutine moving the existing output of every job from its previous destination to its new one. Directories left empty are removed.
+
+    async def moveFiles(self, jobs):
+        results = []
+        
+        for job in jobs:
+            try:
+                with timeStage(job, "move"):
+                    await self.runBlocking(moveFile, job.previous_destination, job.destination)
+                    await self.runBlocking(removeEmptyDirectories, os.path.dirname(job.previous_destination), job.profile.destination)
+                
+                results.append(JobResult(job, True, "SUCCESS (MOVED)"))
+            except OSError as err:
+                results.append(JobResult(job, False, "FAIL", str(err)))
+        
+        return results
+
+    # Method: deleteFiles(jobs)
+    # Arguments:
+    #   - jobs: Jobs of type "delete" of the same removed source file
+    # Description: Coroutine deleting the orphaned output of every job. Directories left empty are removed.
+
+    async def deleteFiles(self, jobs):
+        results = []
+        
+        for job in jobs:
+            try:
+                with timeStage(job, "delete"):
+                    if os.path.lexists(job.destination):
+                        await self.runBlocking(os.remove, job.destination)
+                    
+                    await self.runBlocking(removeEmptyDirectories, os.path.dirname(job.destination), job.profile.destination)
+                
+                results.append(JobResult(job, True, "SUCCESS"))
+            except OSError as err:
+                results.append(JobResult(job, False, "FAIL", str(err)))
+        
+        return results
+
+    # Method: verifyOutput(job)
+    # Arguments:
+    #   - job: Job of type "exists"
+    # Description: Coroutine checking if the existing output of the job is complete using 'checkOutput' and, if 'verify_decode' is set, by decoding it with ffmpeg. Returns an error message describing the problem, which is empty if the output is fine.
+
+    async def verifyOutput(self, job):
+        if not os.path.exists(job.destination):
+            return "The file is missing"
+        
+        source_type = job_types[os.path.splitext(job.source)[1].lower()]
+        
+        try:
+            error = await self.runBlocking(checkOutput, job.source, job.destination, source_type)
+        except OSError as err:
+            return "The file could not be read: "+str(err)
+        
+        if error == "" and self.settings["verify_decode"] and source_type in ("mp3", "flac"):
+            result_decode = await runProcess(["ffmpeg", "-hide_banner", "-loglevel", "error", "-xerror", "-i", job.destination, "-map", "0:a", "-f", "null", "-"])
+            
+            if result_decode.returncode != 0 or result_decode.stderr.strip() != b"":
+                error = "The file could not be decoded"
+        
+        return error
+
+    # Method: renewLease(lease)
+    # Arguments:
+    #   - lease: Path of a lease created by 'WorkClaims.claim'
+    # Description: Coroutine renewing the lease four times per lease timeout, until it is cancelled.
+
+    async def renewLease(self, lease):
+        while True:
+            await asyncio.sleep(self.settings["lease_timeout"] / 4)
+            
+            try:
+                await self.runBlocking(self.work_claims.renew, lease)
+            except OSError as err:
+                logger.warning("Could not renew lease "+lease+": "+str(err))
+
+    # Method: runJobGroup(jobs)
+    # Arguments:
+    #   - jobs: Jobs of the same source file, as returned by 'groupJobs'
+    # Description: Coroutine executing the jobs of one source file together and returning their results, after claiming the file if a claim directory is shared. Outputs are written to temporary files and renamed once they are complete, and successful jobs are recorded in the manifest.
+
+    async def runJobGroup(self, jobs):
+        timings = {}
+        starttime = time.perf_counter()
+        
+        for job in jobs:
+            job.timings = timings
+        
+        #The hash is only needed if a job gets recorded in the manifest
+        hash_jobs = [job for job in jobs if self.settings["hash_sources"] and job.record and job.hash is None]
+        fingerprint_jobs = [job for job in jobs if job.record and job.fingerprint is None]
+        verify_jobs = [job for job in jobs if self.settings["verify"] and job.type == "exists" and not job.shadowed]
+        work_jobs = [job for job in jobs if job.type != "exists"]
+        results = []
+        #Destinations, whose temporary file was already renamed or removed
+        finished_outputs = set()
+        lease = None
+        renew_task = None
+        
+        try:
+            #Existing files don't take up one of the slots, unless they are verified or their hash or fingerprint has to be calculated
+            if len(work_jobs) > 0 or len(hash_jobs) > 0 or len(fingerprint_jobs) > 0 or len(verify_jobs) > 0:
+                async with self.getSemaphore():
+                    #Waiting for a free slot doesn't count towards the time of the jobs
+                    starttime = time.perf_counter()
+                    
+                    if self.work_claims is not None:
+                        lease = await self.runBlocking(self.work_claims.claim, jobs[0], self.source_path)
+                        
+                        #Another converter processes or processed the file
+                        if lease is None:
+                            for job in jobs:
+                                job.type = "claimed"
+                            
+                            return [JobResult(job, True, "CLAIMED") for job in jobs]
+                        
+                        renew_task = asyncio.ensure_future(self.renewLease(lease))
+                    
+                    for job in verify_jobs:
+                        with timeStage(job, "verify"):
+                            job.verify_error = await self.verifyOutput(job)
+                        
+                        #Convert or copy broken files again
+                        if job.verify_error != "":
+                            job.type = job_types[os.path.splitext(job.source)[1].lower()]
+                            job.record = job.manifest_key is not None
+                            work_jobs.append(job)
+                            
+                            if job.record and self.settings["hash_sources"] and job.hash is None:
+                                hash_jobs.append(job)
+                            
+                            if job.record and job.fingerprint is None:
+                                fingerprint_jobs.append(job)
+                    
+                    if len(hash_jobs) > 0:
+                        with timeStage(jobs[0], "hash"):
+                            filehash = await self.runBlocking(hashFile, jobs[0].source)
+                        
+                        for job in hash_jobs:
+                            job.hash = filehash
+                    
+                    if len(fingerprint_jobs) > 0:
+                        with timeStage(jobs[0], "fingerprint"):
+                            fingerprint = await self.runBlocking(fingerprintFile, jobs[0].source, jobs[0].size)
+                        
+                        for job in fingerprint_jobs:
+                            job.fingerprint = fingerprint
+                    
+                    #If new file paths do not exist, create them
+                    for job in work_jobs:
+                        if job.type != "delete":
+                            os.makedirs(os.path.dirname(job.destination), exist_ok=True)
+                    
+                    #Remove temporary files left by stopped converters once per directory
+                    for directory in dict.fromkeys(os.path.dirname(job.destination) for job in work_jobs if job.type in output_types):
+                        if directory not in self.swept_directories:
+                            self.swept_directories.add(directory)
+                            removed = await self.runBlocking(removeStaleTemporaryFiles, directory, self.settings["lease_timeout"])
+                            
+                            if removed > 0:
+                                logger.info("Removed "+str(removed)+" stale temporary files in "+directory)
+                    
+                    #In mirror mode, the jobs of a file can have different types (e.g. moved for one profile, but converted for another)
+                    for job_type in dict.fromkeys(job.type for job in work_jobs):
+                        for result in await self.group_functions[job_type]([job for job in work_jobs if job.type == job_type]):
+                            if job_type in output_types:
+                                if result.success:
+                                    await self.runBlocking(commitOutput, result.job.destination)
+                                else:
+                                    await self.runBlocking(discardOutput, result.job.destination)
+                                
+                                finished_outputs.add(result.job.destination)
+                            
+                            if result.success and job_type != "delete":
+                                result.output_bytes = os.path.getsize(result.job.destination)
+                            
+                            results.append(result)
+            
+            results += [JobResult(job, True, "EXISTS") for job in jobs if job.type == "exists"]
+        except Exception as err:
+            results = [JobResult(job, False, "FAIL", str(err)) for job in jobs]
+        finally:
+            #Also runs if the task is cancelled or interrupted, in which case incomplete outputs are removed as well
+            for job in work_jobs:
+                if job.type in output_types and job.destination not in finished_outputs:
+                    try:
+                        discardOutput(job.destination)
+                    except OSError as err:
+                        logger.warning("Could not remove temporary file of "+job.destination+": "+str(err))
+            
+            if renew_task is not None:
+                renew_task.cancel()
+            
+            #Failed, cancelled or interrupted files can be claimed again by another converter
+            if lease is not None:
+                self.work_claims.release(lease, len(results) == len(jobs) and all(result.success for result in results))
+        
+        elapsed = time.perf_counter() - starttime
+        
+        for result in results:
+            result.job.time = elapsed
+            manifest = self.manifests.get(result.job.profile.name)
+            
+            if result.success and manifest is not None:
+                if result.job.record:
+                    manifest.record(result.job)
+                
+                if result.job.previous_key is not None and result.job.previous_key != result.job.manifest_key:
+                    manifest.remove(result.job.previous_key)
+        
+        return results
+
+    # Method: runJob(job)
+    # Arguments:
+    #   - job: Job, which was created by 'plan' or 'createJobs'
+    # Description: Coroutine executing a single job like 'runJobGroup' and returning its result.
+
+    async def runJob(self, job):
+        return (await self.runJobGroup([job]))[0]
+
+    # Method: getAlbumKey(job)
+    # Arguments:
+    #   - job: Any job
+    # Description: Returns the profile name and the source directory of the job, if its source file is an audio file and its profile writes ReplayGain tags, or None otherwise. Every source directory is an album.
+
+    def getAlbumKey(self, job):
+        if not job.profile.replaygain or job_types.get(os.path.splitext(job.source)[1].lower()) not in ("mp3", "flac"):
+            return None
+        
+        return (job.profile.name, os.path.dirname(job.source))
+
+    # Method: tagAlbum(profile, directory, jobs)
+    # Arguments:
+    #   - profile: Encode profile writing ReplayGain tags
+    #   - directory: Source directory of the album
+    #   - jobs: Jobs of the album executed in this run
+    # Description: Coroutine writing the track and album gains into the outputs of all tracks of the album, after claiming it if a claim directory is shared. Nothing is written, if the loudness of a track is unknown or outdated.
+
+    async def tagAlbum(self, profile, directory, jobs):
+        lease = None
+        renew_task = None
+        
+        if self.work_claims is not None:
+            lease = await self.runBlocking(self.work_claims.claimAlbum, profile, directory, self.source_path, min(job.planned for job in jobs))
+            
+            #Another converter wrote the album gain after this one planned the album
+            if lease is None:
+                return
+            
+            renew_task = asyncio.ensure_future(self.renewLease(lease))
+        
+        tagged_album = False
+        
+        try:
+            #The manifest can only be read from the thread, which opened it
+            tracks = self.getAlbumTracks(profile, directory, jobs)
+            
+            if len(tracks) == 0:
+                return
+            
+            if any(loudness is None for path, loudness in tracks):
+                if not self.isShared():
+                    logger.warning("No album gain written for "+directory+", as the loudness of some tracks is unknown")
+                return
+            
+            album = getAlbumLoudness([loudness for path, loudness in tracks])
+            tagged_album = True
+            
+            for path, loudness in tracks:
+                try:
+                    tagged = await self.writeGain(path, loudness, album)
+                except Exception as err:
+                    logger.warning("Could not write the album gain into "+path+": "+str(err))
+                    continue
+                
+                if not tagged:
+                    logger.warning("Could not write the album gain into "+path)
+        finally:
+            if renew_task is not None:
+                renew_task.cancel()
+            
+            #An incomplete album is left to the converter finishing its last track
+            if lease is not None:
+                self.work_claims.release(lease, tagged_album)
+
+    # Method: getAlbumTracks(profile, directory, jobs)
+    # Arguments:
+    #   - profile: Encode profile writing ReplayGain tags
+    #   - directory: Source directory of the album
+    #   - jobs: Jobs of the album executed in this run
+    # Description: Returns the output path and the loudness of every audio file in the source directory, taken from the manifest or the jobs and skipping shadowed files. The loudness is None, if it is unknown or outdated.
+
+    def getAlbumTracks(self, profile, directory, jobs):
+        manifest = self.manifests.get(profile.name)
+        
+        try:
+            with os.scandir(directory) as entries:
+                sources = sorted([entry for entry in entries if entry.is_file() and job_types.get(os.path.splitext(entry.name)[1].lower()) in ("mp3", "flac")], key=lambda entry: entry.name)
+        except OSError as err:
+            logger.warning("Could not scan directory "+directory+": "+str(err))
+            return []
+        
+        claimed_destinations = set()
+        shadowed_sources = set()
+        
+        for source in sources:
+            destination = getDestinationPath(os.path.relpath(source.path, self.source_path), job_types[os.path.splitext(source.name)[1].lower()], profile)
+            
+            if destination in claimed_destinations:
+                shadowed_sources.add(source.path)
+            
+            claimed_destinations.add(destination)
+        
+        sources = [source for source in sources if source.path not in shadowed_sources]
+        tracks = []
+        
+        if manifest is not None:
+            relpath = os.path.relpath(directory, self.source_path)
+            manifest_entries = manifest.readDirectory("" if relpath == "." else relpath)
+            
+            for source in sources:
+                entry = manifest_entries.get(os.path.relpath(source.path, self.source_path))
+                
+                if entry is None:
+                    tracks.append((None, None))
+                    continue
+                
+                #The file may have been removed in the meantime
+                try:
+                    source_stat = source.stat()
+                    current = entry["size"] == source_stat.st_size and entry["mtime"] == source_stat.st_mtime_ns
+                except OSError:
+                    current = False
+                
+                tracks.append((os.path.join(profile.destination, entry["destination"]), entry["loudness"] if current else None))
+        else:
+            source_jobs = {job.source: job for job in jobs if job.type != "delete" and not job.shadowed}
+            
+            for source in sources:
+                job = source_jobs.get(source.path)
+                tracks.append((job.destination, job.loudness) if job is not None else (None, None))
+        
+        return tracks
+
+    # Method: iterResults(jobs=None)
+    # Arguments:
+    #   - jobs: Iterable of jobs. Defaults to None, in which case the whole library is planned using 'plan'.
+    # Description: Asynchronous generator executing the jobs and yielding their results in the order, in which they finish. If a profile writes ReplayGain tags, 'tagAlbum' is called once all jobs of an album finished and one of its tracks changed.
+
+    async def iterResults(self, jobs=None):
+        if jobs is None:
+            jobs = self.plan()
+        
+        albums = {}
+        
+        if any(profile.replaygain for profile in self.profiles):
+            jobs = list(jobs)
+            
+            for job in jobs:
+                album_key = self.getAlbumKey(job)
+                
+                if album_key is not None:
+                    album = albums.setdefault(album_key, {"profile": job.profile, "remaining": 0, "jobs": [], "changed": False})
+                    album["remaining"] += 1
+        
+        async for results in boundedResults(self.runJobGroup, self.groupJobs(jobs), self.settings["jobs"] * 2):
+            for result in results:
+                yield result
+            
+            for result in results:
+                album_key = self.getAlbumKey(result.job)
+                
+                if album_key not in albums:
+                    continue
+                
+                album = albums[album_key]
+                album["remaining"] -= 1
+                album["jobs"].append(result.job)
+                album["changed"] = album["changed"] or (result.success and result.job.type in ("mp3", "flac", "move", "gain", "delete"))
+                
+                if album["remaining"] == 0:
+                    del albums[album_key]
+                    
+                    #The directory is gone, if all tracks were deleted
+                    if album["changed"] and os.path.isdir(album_key[1]):
+                        await self.tagAlbum(album["profile"], album_key[1], album["jobs"])
+
+    # Method: convertAsync(jobs=None)
+    # Arguments:
+    #   - jobs: Iterable of jobs. Defaults to None, in which case the whole library is planned using 'plan'.
+    # Description: Coroutine executing the jobs and returning the list of their results.
+
+    async def convertAsync(self, jobs=None):
+        return [result async for result in self.iterResults(jobs)]
+
+    # Method: convert(jobs=None)
+    # Arguments:
+    #   - jobs: Iterable of jobs. Defaults to None, in which case the whole library is planned using 'plan'.
+    # Description: Executes the jobs in a new event loop and returns the list of their results. Can't be called from inside of a running event loop, use 'convertAsync' there.
+
+    def convert(self, jobs=None):
+        return asyncio.run(self.convertAsync(jobs))
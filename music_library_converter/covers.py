@@ -0,0 +1,191 @@
+# coding: utf8
+
+# Music Library Converter - Covers
+# by JoeJoeTV - 2020,2021
+# Converts and scales embedded covers and caches the results
+
+
+import os
+import io
+import hashlib
+import threading
+import collections
+from PIL import Image
+from resizeimage import resizeimage
+
+#Functions
+#----------
+
+# Function: coverNeedsRework(cover, convert_cover, cover_size)
+# Arguments:
+#   - cover: Cover as returned by 'readAudioFileMetadata'
+#   - convert_cover: If the cover should be converted to JPEG
+#   - cover_size: The size the cover should be scaled to or 0
+# Description: Checks if the cover has to be converted or scaled. Covers, which are already JPEGs within 'cover_size', can be kept as they are.
+
+def coverNeedsRework(cover, convert_cover, cover_size):
+    if convert_cover and cover["format"] != "JPEG":
+        return True
+    
+    if cover_size > 0:
+        #Let Pillow decide if the dimensions are unknown
+        if cover["width"] == 0 or cover["height"] == 0:
+            return True
+        
+        if cover["width"] > cover_size or cover["height"] > cover_size:
+            return True
+    
+    return False
+
+# Function: convertCover(cover_data, convert_cover=True, cover_size=0)
+# Arguments:
+#   - cover_data: Content of the cover image file, which should be converted
+#   - convert_cover: If the cover should be converted. Defaults to True.
+#   - cover_size: The size the cover should be scaled to. Any value greater than 0 means that the cover will get scaled. Defaults to 0.
+# Description: Converts the given image according to the other arguments and returns the content of the new image file. If nothing has to be changed, 'cover_data' is returned as it is.
+
+def convertCover(cover_data, convert_cover=True, cover_size=0):
+    cover = Image.open(io.BytesIO(cover_data))
+    original_format = cover.format
+    
+    needs_resize = cover_size > 0 and ((cover.height > cover_size) or (cover.width > cover_size))
+    needs_conversion = convert_cover and original_format != "JPEG"
+    
+    if not (needs_resize or needs_conversion):
+        return cover_data
+    
+    if needs_resize:
+        cover = resizeimage.resize_thumbnail(cover, [cover_size, cover_size])
+    
+    new_cover = io.BytesIO()
+    
+    if needs_conversion:
+        cover = cover.convert("RGB")
+        cover.save(new_cover, format="JPEG")
+    else:
+        cover.save(new_cover, format=original_format)
+    
+    return new_cover.getvalue()
+
+#Classes
+#--------
+
+# Class: CoverCache
+# Description: Least recently used cache of converted covers, shared between all jobs and profiles of a converter. Every distinct cover is only converted once for the same cover settings and can additionally be stored in a directory, so it can be reused by later runs. All methods can be called from multiple threads.
+
+class CoverCache:
+
+    # Method: __init__(settings)
+    # Arguments:
+    #   - settings: Settings of the converter. 'cover_cache_dir' and 'cover_cache_memory' are used.
+    # Description: Creates an empty cache.
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.covers = collections.OrderedDict()
+        self.size = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0
+        }
+
+    # Method: getKey(cover_data, convert_cover, cover_size)
+    # Arguments:
+    #   - cover_data: Content of an embedded cover
+    #   - convert_cover: If the cover is converted to JPEG
+    #   - cover_size: The size the cover is scaled to or 0
+    # Description: Returns the key of the given cover in the cover cache, which consists of the hash of the cover and the cover settings.
+
+    def getKey(self, cover_data, convert_cover, cover_size):
+        cover_format = "jpeg" if convert_cover else "original"
+        return hashlib.sha256(cover_data).hexdigest()+"_"+cover_format+"_"+str(cover_size)
+
+    # Method: store(key, cover_data)
+    # Arguments:
+    #   - key: Key of the cover in the cover cache
+    #   - cover_data: Content of the processed cover
+    # Description: Stores a processed cover in the in-memory cache and removes the least recently used covers, if the cache exceeds its size limit. Must be called while holding 'lock'.
+
+    def store(self, key, cover_data):
+        self.covers[key] = cover_data
+        self.size += len(cover_data)
+        
+        while self.size > self.settings["cover_cache_memory"] and len(self.covers) > 1:
+            old_key, old_data = self.covers.popitem(last=False)
+            self.size -= len(old_data)
+
+    # Method: getPath(key)
+    # Arguments:
+    #   - key: Key of the cover in the cover cache
+    # Description: Returns the path of the given cover in the on-disk cover cache.
+
+    def getPath(self, key):
+        return os.path.join(self.settings["cover_cache_dir"], key[0:2], key)
+
+    # Method: convert(cover_data, convert_cover, cover_size)
+    # Arguments:
+    #   - cover_data: Content of an embedded cover
+    #   - convert_cover: If the cover should be converted to JPEG
+    #   - cover_size: The size the cover should be scaled to or 0
+    # Description: Returns the converted cover like 'convertCover' does, but every distinct cover is only converted once. If another job is already converting the same cover, this waits for its result instead of converting the cover again.
+
+    def convert(self, cover_data, convert_cover, cover_size):
+        key = self.getKey(cover_data, convert_cover, cover_size)
+        
+        while True:
+            with self.lock:
+                if key in self.covers:
+                    self.covers.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return self.covers[key]
+                
+                event = self.pending.get(key)
+                
+                if event is None:
+                    event = threading.Event()
+                    self.pending[key] = event
+                    break
+            
+            event.wait()
+        
+        try:
+            new_cover_data = None
+            
+            #Check the on-disk cache of previous runs
+            if self.settings["cover_cache_dir"] != "":
+                try:
+                    with open(self.getPath(key), "rb") as f:
+                        new_cover_data = f.read()
+                except OSError:
+                    pass
+            
+            if new_cover_data is not None:
+                with self.lock:
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+            else:
+                with self.lock:
+                    self.counters["misses"] += 1
+                
+                new_cover_data = convertCover(cover_data, convert_cover, cover_size)
+                
+                if self.settings["cover_cache_dir"] != "":
+                    cache_path = self.getPath(key)
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    
+                    #Write to a temporary file first, so other processes never read incomplete covers
+                    with open(cache_path+".tmp"+str(threading.get_ident()), "wb") as f:
+                        f.write(new_cover_data)
+                    os.replace(cache_path+".tmp"+str(threading.get_ident()), cache_path)
+            
+            with self.lock:
+                self.store(key, new_cover_data)
+            
+            return new_cover_data
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
@@ -0,0 +1,108 @@
+# coding: utf8
+
+# Music Library Converter - Executor
+# by JoeJoeTV - 2020,2021
+# Runs external processes and many jobs at once from a single asyncio event loop
+
+
+import os
+import asyncio
+import subprocess
+
+#Variables and Constants
+#------------------------
+
+#Additional pipes can only be passed to processes on POSIX systems
+pipe_inputs_supported = os.name == "posix"
+
+#Classes
+#--------
+
+# Class: PipeInput
+# Description: Placeholder in the arguments of 'runProcess', which is replaced by "pipe:<fd>" of a pipe the data is written to. Only supported if 'pipe_inputs_supported' is True.
+
+class PipeInput:
+
+    # Method: __init__(data)
+    # Arguments:
+    #   - data: Bytes, which are written to the pipe
+    # Description: Creates the placeholder.
+
+    def __init__(self, data):
+        self.data = data
+
+#Functions
+#----------
+
+# Function: runProcess(arguments, input_data=None)
+# Arguments:
+#   - arguments: Program and arguments of the process. Arguments can be 'PipeInput' objects.
+#   - input_data: Bytes written to the standard input of the process. Defaults to None, in which case the standard input is closed.
+# Description: Coroutine starting the process without blocking the event loop and waiting until it exits. Returns a 'subprocess.CompletedProcess' containing the exit code as well as the standard output and error. The process is killed if the coroutine gets cancelled.
+
+async def runProcess(arguments, input_data=None):
+    loop = asyncio.get_running_loop()
+    arguments = list(arguments)
+    pipes = []
+    
+    try:
+        for i, argument in enumerate(arguments):
+            if isinstance(argument, PipeInput):
+                read_fd, write_fd = os.pipe()
+                pipes.append((read_fd, write_fd, argument.data))
+                arguments[i] = "pipe:"+str(read_fd)
+        
+        process = await asyncio.create_subprocess_exec(*arguments, stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=[read_fd for read_fd, write_fd, data in pipes])
+    except BaseException:
+        for read_fd, write_fd, data in pipes:
+            os.close(write_fd)
+        raise
+    finally:
+        #The process has its own copies of the read ends
+        for read_fd, write_fd, data in pipes:
+            os.close(read_fd)
+    
+    #The data is written by the event loop while the process is running, so large inputs don't block
+    for read_fd, write_fd, data in pipes:
+        transport, protocol = await loop.connect_write_pipe(asyncio.Protocol, open(write_fd, "wb", buffering=0))
+        transport.write(data)
+        transport.close()
+    
+    try:
+        stdout, stderr = await process.communicate(input_data)
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    
+    return subprocess.CompletedProcess(arguments, process.returncode, stdout, stderr)
+
+# Function: boundedResults(function, items, limit)
+# Arguments:
+#   - function: Coroutine function, which is called for every item
+#   - items: Iterable of items. It is only consumed as fast as the items are processed, so it can be a generator.
+#   - limit: Maximum number of items, which are processed at the same time
+# Description: Asynchronous generator calling 'function' for every item and yielding the results in the order, in which they finish. At most 'limit' items are processed at once.
+
+async def boundedResults(function, items, limit):
+    pending = set()
+    
+    try:
+        for item in items:
+            while len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    yield task.result()
+            
+            pending.add(asyncio.ensure_future(function(item)))
+        
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
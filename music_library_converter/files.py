@@ -0,0 +1,254 @@
+# coding: utf8
+
+# Music Library Converter - File Copying
+# by JoeJoeTV - 2020,2021
+# Copies files using reflinks, hard links or kernel-side copies where possible
+
+
+import os
+import re
+import time
+import errno
+import socket
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#Variables and Constants
+#------------------------
+
+#ioctl request for cloning a file on Linux and errors of 'copy_file_range'/'sendfile' meaning that they can't be used for the given files
+FICLONE = 0x40049409
+unsupported_copy_errors = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM)
+#FILE lines of cue sheets referencing a FLAC file. Cue sheets can use any encoding, so they are matched as bytes.
+cue_flac_file = re.compile(rb'^(\s*FILE\s+"?[^"\r\n]*)\.flac("?)', re.IGNORECASE | re.MULTILINE)
+#Name of this converter in unique temporary paths, which includes the host name, as converters on several hosts can share a destination
+temporary_owner = socket.gethostname()+"-"+str(os.getpid())
+
+#Functions
+#----------
+
+# Function: copyFileData(source_fd, destination_fd, source_offset, destination_offset, count)
+# Arguments:
+#   - source_fd: File descriptor of the file, which is copied from
+#   - destination_fd: File descriptor of the file, which is copied to
+#   - source_offset: Position in the source file, from which the copying starts
+#   - destination_offset: Position in the destination file, to which the data is copied
+#   - count: Number of bytes, which should be copied
+# Description: Copies data between two files. If possible, the data is copied inside of the kernel using 'copy_file_range' or 'sendfile', so it never has to be read into Python.
+
+def copyFileData(source_fd, destination_fd, source_offset, destination_offset, count):
+    if hasattr(os, "copy_file_range"):
+        while count > 0:
+            try:
+                copied = os.copy_file_range(source_fd, destination_fd, min(count, 1073741824), source_offset, destination_offset)
+            except OSError as err:
+                if err.errno in unsupported_copy_errors:
+                    break
+                raise
+            
+            if copied == 0:
+                return
+            
+            count -= copied
+            source_offset += copied
+            destination_offset += copied
+    
+    if count > 0 and hasattr(os, "sendfile"):
+        os.lseek(destination_fd, destination_offset, os.SEEK_SET)
+        
+        while count > 0:
+            try:
+                copied = os.sendfile(destination_fd, source_fd, source_offset, min(count, 1073741824))
+            except OSError as err:
+                if err.errno in unsupported_copy_errors:
+                    break
+                raise
+            
+            if copied == 0:
+                return
+            
+            count -= copied
+            source_offset += copied
+            destination_offset += copied
+    
+    #Fall back to copying the data in chunks
+    if count > 0:
+        os.lseek(source_fd, source_offset, os.SEEK_SET)
+        os.lseek(destination_fd, destination_offset, os.SEEK_SET)
+        
+        while count > 0:
+            chunk = os.read(source_fd, min(count, 1048576))
+            
+            if not chunk:
+                return
+            
+            os.write(destination_fd, chunk)
+            count -= len(chunk)
+
+# Function: copyFile(source, destination, mode="auto")
+# Arguments:
+#   - source: Path of the file, which should be copied
+#   - destination: Path, to which the file should be copied
+#   - mode: "auto" to clone the file (reflink) if the file system supports it and to copy it inside of the kernel otherwise, "hardlink" to create a hard link if possible, "copy" to always copy the data. Defaults to "auto".
+# Description: Copies a file using the fastest method allowed by 'mode'. Returns the method, which was used in the end ("hardlink", "reflink" or "copy").
+
+def copyFile(source, destination, mode="auto"):
+    if mode == "hardlink":
+        link_path = destination+".cml-link"
+        
+        try:
+            os.link(source, link_path)
+            os.replace(link_path, destination)
+            return "hardlink"
+        except OSError:
+            if os.path.lexists(link_path):
+                os.remove(link_path)
+    
+    binary_flag = getattr(os, "O_BINARY", 0)
+    source_fd = os.open(source, os.O_RDONLY | binary_flag)
+    
+    try:
+        destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | binary_flag, 0o666)
+        
+        try:
+            #Clone the file, so both share their data blocks until one of them is changed
+            if mode != "copy" and fcntl is not None:
+                try:
+                    fcntl.ioctl(destination_fd, FICLONE, source_fd)
+                    return "reflink"
+                except OSError:
+                    pass
+            
+            copyFileData(source_fd, destination_fd, 0, 0, os.fstat(source_fd).st_size)
+            return "copy"
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+
+# Function: getTemporaryPath(path, unique=False)
+# Arguments:
+#   - path: Path of an output file
+#   - unique: If the path should only be used by this converter. Needed for files, which aren't claimed by the converter writing them (e.g. when the album gain is written). Defaults to False.
+# Description: Returns the hidden path in the same directory, to which the output is written before it is complete. The file extension is kept, so ffmpeg still chooses the right format.
+
+def getTemporaryPath(path, unique=False):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, ".cml-tmp-"+(temporary_owner+"-" if unique else "")+filename)
+
+# Function: commitOutput(path, unique=False)
+# Arguments:
+#   - path: Path of an output file, which was completely written to its temporary path
+#   - unique: If the output was written to the unique temporary path. Defaults to False.
+# Description: Renames the temporary file to 'path'. As the rename is atomic, 'path' never contains an incomplete file, even if the converter is killed.
+
+def commitOutput(path, unique=False):
+    os.replace(getTemporaryPath(path, unique), path)
+
+# Function: discardOutput(path, unique=False)
+# Arguments:
+#   - path: Path of an output file, which couldn't be written
+#   - unique: If the output was written to the unique temporary path. Defaults to False.
+# Description: Removes the temporary file of the output, if it exists.
+
+def discardOutput(path, unique=False):
+    temporary_path = getTemporaryPath(path, unique)
+    
+    if os.path.lexists(temporary_path):
+        os.remove(temporary_path)
+
+# Function: removeStaleTemporaryFiles(directory, max_age)
+# Arguments:
+#   - directory: Path of a directory in a destination library
+#   - max_age: Time in seconds, after which a temporary file, which isn't changed anymore, is stale
+# Description: Removes the temporary files left in the directory by converters, which were stopped while writing them, and returns their number.
+
+def removeStaleTemporaryFiles(directory, max_age):
+    removed = 0
+    
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    
+    for entry in entries:
+        try:
+            if entry.name.startswith(".cml-tmp-") and entry.is_file(follow_symlinks=False) and time.time() - entry.stat(follow_symlinks=False).st_mtime > max_age:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    
+    return removed
+
+# Function: moveFile(source, destination)
+# Arguments:
+#   - source: Path of the file, which should be moved
+#   - destination: Path, to which the file should be moved
+# Description: Moves a file, creating the directory of 'destination' if necessary. Files are renamed if both paths are on the same file system and copied to a temporary file first and removed otherwise.
+
+def moveFile(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    
+    try:
+        os.replace(source, destination)
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        
+        copyFile(source, getTemporaryPath(destination), "copy")
+        commitOutput(destination)
+        os.remove(source)
+
+# Function: removeEmptyDirectories(path, root)
+# Arguments:
+#   - path: Path of a directory, from which a file was removed
+#   - root: Path of the library containing 'path', which is never removed
+# Description: Removes 'path' and its parent directories up to 'root', as long as they are empty.
+
+def removeEmptyDirectories(path, root):
+    path = os.path.abspath(path)
+    root = os.path.abspath(root)
+    
+    while path != root and path.startswith(root+os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        
+        path = os.path.dirname(path)
+
+# Function: readFile(path)
+# Arguments:
+#   - path: Path of the file, which should be read
+# Description: Returns the content of the file.
+
+def readFile(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# Function: writeFile(path, data)
+# Arguments:
+#   - path: Path of the file, which should be written
+#   - data: Content of the file
+# Description: Writes the given data to a file, replacing its previous content.
+
+def writeFile(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+# Function: rewriteCueSheet(source, destination, extension)
+# Arguments:
+#   - source: Path of a cue sheet
+#   - destination: Path of the new cue sheet
+#   - extension: File extension of converted FLAC files (e.g. ".mp3")
+# Description: Writes a copy of the cue sheet, in which all references to FLAC files are changed to the converted files.
+
+def rewriteCueSheet(source, destination, extension):
+    with open(source, "rb") as f:
+        cue_sheet = f.read()
+    
+    writeFile(destination, cue_flac_file.sub(lambda match: match.group(1)+extension.encode("ascii")+match.group(2), cue_sheet))
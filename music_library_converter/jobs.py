@@ -0,0 +1,104 @@
+# coding: utf8
+
+# Music Library Converter - Jobs
+# by JoeJoeTV - 2020,2021
+# Jobs describing a single file, which is converted or copied, and their results
+
+
+import os
+import time
+import contextlib
+import dataclasses
+
+#Variables and Constants
+#------------------------
+
+#Job type for every supported source file extension. Lyrics in text files are copied like LRC files, images are folder art.
+job_types = {
+    ".mp3": "mp3",
+    ".flac": "flac",
+    ".lrc": "lrc",
+    ".txt": "lrc",
+    ".cue": "cue",
+    ".jpg": "art",
+    ".jpeg": "art",
+    ".png": "art"
+}
+
+#Classes
+#--------
+
+# Class: ConversionJob
+# Description: A single source file and the destination it is converted or copied to using the encode profile 'profile'. 'type' is the type of the source file (see 'job_types'), "exists", "claimed", "move", "gain" or "delete", and the other fields are filled in by the planner and while the job is executed.
+
+@dataclasses.dataclass
+class ConversionJob:
+    type: str
+    source: str
+    destination: str
+    size: int = 0
+    mtime: int = 0
+    profile: object = None
+    manifest_key: str = None
+    destination_key: str = None
+    settings_key: str = None
+    record: bool = False
+    hash: str = None
+    fingerprint: str = None
+    previous_key: str = None
+    previous_destination: str = None
+    shadowed: bool = False
+    verify_error: str = ""
+    loudness: dict = None
+    timings: dict = dataclasses.field(default_factory=dict)
+    time: float = 0
+    exit_code: int = None
+    cover_bytes: int = 0
+    #The field "time" hides the module inside of the class body
+    planned: float = dataclasses.field(default_factory=lambda: time.time())
+
+    # Method: fromPath(source, destination, profile=None)
+    # Arguments:
+    #   - source: Path of an audio file or a companion file (see 'job_types')
+    #   - destination: Path, to which the converted or copied file should be written
+    #   - profile: Encode profile of the job. Defaults to None.
+    # Description: Creates a job for the given file, using its extension as the job type and reading its size and modification time. Raises ValueError for unsupported file types.
+
+    @classmethod
+    def fromPath(cls, source, destination, profile=None):
+        job_type = job_types.get(os.path.splitext(source)[1].lower())
+        
+        if job_type is None:
+            raise ValueError("Unsupported file type: "+source)
+        
+        source_stat = os.stat(source)
+        return cls(job_type, source, destination, source_stat.st_size, source_stat.st_mtime_ns, profile)
+
+# Class: JobResult
+# Description: Result of an executed job. 'status' is the short status text (e.g. "SUCCESS (CONVERT)"), 'error' describes why the job failed and 'output_bytes' is the size of the written file.
+
+@dataclasses.dataclass
+class JobResult:
+    job: ConversionJob
+    success: bool
+    status: str
+    error: str = ""
+    output_bytes: int = 0
+
+#Functions
+#----------
+
+# Function: timeStage(job, stage)
+# Arguments:
+#   - job: Job, which is currently executed
+#   - stage: Name of the stage (e.g. "probe", "cover", "ffmpeg", "copy", "lrc", "hash", "fingerprint", "verify", "move", "delete", "loudness" or "replaygain")
+# Description: Context manager measuring how long the enclosed code takes and adding the time to the timings of the stage in 'job'.
+
+@contextlib.contextmanager
+def timeStage(job, stage):
+    starttime = time.perf_counter()
+    
+    try:
+        yield
+    finally:
+        job.timings[stage] = job.timings.get(stage, 0) + time.perf_counter() - starttime
@@ -0,0 +1,103 @@
+# coding: utf8
+
+# Music Library Converter - Logging
+# by JoeJoeTV - 2020,2021
+# Writes the log from a background thread, either as plain text or as JSON lines
+
+
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+#Variables and Constants
+#------------------------
+
+log_formats = ("text", "json")
+#Attributes of log records, which are added to JSON lines if they were given using 'extra'
+record_fields = ("event", "type", "source", "destination", "status", "error", "seconds")
+
+#Classes
+#--------
+
+# Class: JSONLineFormatter
+# Description: Formats every log record as a single line of JSON containing the time, the level, the message and the fields of 'record_fields', which are set for the record.
+
+class JSONLineFormatter(logging.Formatter):
+
+    # Method: format(record)
+    # Arguments:
+    #   - record: Log record
+    # Description: Returns the JSON line of the record.
+
+    def format(self, record):
+        line = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        
+        for field in record_fields:
+            if hasattr(record, field):
+                line[field] = getattr(record, field)
+        
+        return json.dumps(line, ensure_ascii=False)
+
+#Functions
+#----------
+
+# Function: startLogging(filename, log_format="text")
+# Arguments:
+#   - filename: Path of the log file or None, if no log should be written
+#   - log_format: "text" for lines like "[12:00:00](INFO) message" or "json" for JSON lines. Defaults to "text".
+# Description: Sets up the root logger, so the log file is written by a background thread, or only warnings and errors are printed to the standard error output if there is no log file. Returns the started 'QueueListener' or None.
+
+def startLogging(filename, log_format="text"):
+    root_logger = logging.getLogger()
+    
+    if filename is None:
+        stderr_handler = logging.StreamHandler(sys.stderr)
+        stderr_handler.setLevel(logging.WARNING)
+        stderr_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        root_logger.addHandler(stderr_handler)
+        return None
+    
+    file_handler = logging.FileHandler(filename, "a", encoding="utf-8")
+    
+    if log_format == "json":
+        file_handler.setFormatter(JSONLineFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter("[%(asctime)s](%(levelname)s) %(message)s", "%H:%M:%S"))
+    
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
+    
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(stopLogging, listener)
+    
+    return listener
+
+# Function: stopLogging(listener)
+# Arguments:
+#   - listener: Listener returned by 'startLogging' or None
+# Description: Writes all remaining log records, stops the background thread and closes the log file.
+
+def stopLogging(listener):
+    if listener is None:
+        return
+    
+    atexit.unregister(stopLogging)
+    listener.stop()
+    
+    root_logger = logging.getLogger()
+    
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is listener.queue:
+            root_logger.removeHandler(handler)
+    
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,142 @@
+# coding: utf8
+
+# Music Library Converter - Loudness
+# by JoeJoeTV - 2020,2021
+# Measures the loudness of decoded files using ffmpeg and writes ReplayGain tags
+
+
+import os
+import re
+import math
+
+from .metadata import rewriteID3Frames, getTXXXDescription, buildTXXXContent
+from .files import getTemporaryPath, commitOutput, discardOutput
+
+#Variables and Constants
+#------------------------
+
+#Arguments of an additional ffmpeg output measuring the EBU R128 loudness and the sample peak of the decoded audio, which only print a summary at the end
+loudness_arguments = ["-map", "0:a", "-af", "ebur128=peak=sample:framelog=quiet", "-f", "null", "-"]
+#Global ffmpeg arguments, which are needed to get the summary (on the standard error) and the duration (on the standard output)
+loudness_log_arguments = ["-loglevel", "info", "-nostats", "-progress", "pipe:1"]
+#Loudness in LUFS, to which ReplayGain 2.0 and Opus (R128) gains adjust the volume
+replaygain_reference = -18.0
+r128_reference = -23.0
+#Tags replaced when the gains of an MP3 file are written
+replaygain_tags = ("REPLAYGAIN_TRACK_GAIN", "REPLAYGAIN_TRACK_PEAK", "REPLAYGAIN_ALBUM_GAIN", "REPLAYGAIN_ALBUM_PEAK")
+summary_loudness = re.compile(r"Integrated loudness:\s+I:\s+(-?[0-9.]+|-?inf) LUFS")
+summary_peak = re.compile(r"Sample peak:\s+Peak:\s+(-?[0-9.]+|-?inf) dBFS")
+progress_time = re.compile(r"^out_time_us=([0-9]+)$", re.MULTILINE)
+
+#Functions
+#----------
+
+# Function: parseLoudness(stdout, stderr)
+# Arguments:
+#   - stdout: Standard output of an ffmpeg process started with 'loudness_log_arguments' and an output using 'loudness_arguments'
+#   - stderr: Standard error of the same process
+# Description: Returns the integrated loudness in LUFS, the sample peak (linear, 1.0 is full scale) and the duration in seconds of the decoded audio, or None if the summary of the measurement is missing.
+
+def parseLoudness(stdout, stderr):
+    stderr = stderr.decode("utf-8", "replace")
+    summary_pos = stderr.rfind("Summary:")
+    
+    if summary_pos == -1:
+        return None
+    
+    loudness = summary_loudness.search(stderr, summary_pos)
+    peak = summary_peak.search(stderr, summary_pos)
+    durations = progress_time.findall(stdout.decode("utf-8", "replace"))
+    
+    if loudness is None or peak is None:
+        return None
+    
+    #Silence is reported as -70 LUFS or less and a peak of -inf dBFS
+    return {
+        "integrated": max(float(loudness.group(1)), -70.0),
+        "peak": 10 ** (float(peak.group(1)) / 20) if "inf" not in peak.group(1) else 0.0,
+        "duration": int(durations[-1]) / 1000000 if len(durations) > 0 else 0.0
+    }
+
+# Function: getAlbumLoudness(tracks)
+# Arguments:
+#   - tracks: List of the loudness of all tracks of an album, as returned by 'parseLoudness'
+# Description: Returns the loudness of the whole album, which is the mean of the energy of the tracks weighted by their duration, and the highest peak of all tracks. Tracks without duration are weighted equally.
+
+def getAlbumLoudness(tracks):
+    weights = [track["duration"] if track["duration"] > 0 else 1.0 for track in tracks]
+    energy = sum(weight * 10 ** (track["integrated"] / 10) for weight, track in zip(weights, tracks)) / sum(weights)
+    
+    return {
+        "integrated": 10 * math.log10(energy),
+        "peak": max(track["peak"] for track in tracks),
+        "duration": sum(track["duration"] for track in tracks)
+    }
+
+# Function: getGainTags(path, track, album=None)
+# Arguments:
+#   - path: Path of the converted or copied file
+#   - track: Loudness of the track
+#   - album: Loudness of the album or None, if only the track gain should be written. Defaults to None.
+# Description: Returns the tags storing the gains of the file by their name. Opus files get R128 gains (as Q7.8 numbers relative to -23 LUFS), all other files ReplayGain 2.0 gains and peaks (relative to -18 LUFS).
+
+def getGainTags(path, track, album=None):
+    tags = {}
+    
+    if os.path.splitext(path)[1].lower() == ".opus":
+        tags["R128_TRACK_GAIN"] = str(max(-32768, min(32767, round((r128_reference - track["integrated"]) * 256))))
+        
+        if album is not None:
+            tags["R128_ALBUM_GAIN"] = str(max(-32768, min(32767, round((r128_reference - album["integrated"]) * 256))))
+    else:
+        tags["REPLAYGAIN_TRACK_GAIN"] = "{0:.2f} dB".format(replaygain_reference - track["integrated"])
+        tags["REPLAYGAIN_TRACK_PEAK"] = "{0:.6f}".format(track["peak"])
+        
+        if album is not None:
+            tags["REPLAYGAIN_ALBUM_GAIN"] = "{0:.2f} dB".format(replaygain_reference - album["integrated"])
+            tags["REPLAYGAIN_ALBUM_PEAK"] = "{0:.6f}".format(album["peak"])
+    
+    return tags
+
+# Function: getGainArguments(path, tags)
+# Arguments:
+#   - path: Path of the converted or copied file
+#   - tags: Tags returned by 'getGainTags'
+# Description: Returns the ffmpeg arguments copying the file with all of its tags and setting the given tags. Used for files, whose tags can't be rewritten directly (Opus and ID3v2.2).
+
+def getGainArguments(path, tags):
+    arguments = ["-map", "0", "-c", "copy", "-map_metadata", "0"]
+    metadata_option = "-metadata"
+    
+    if os.path.splitext(path)[1].lower() == ".opus":
+        #Vorbis comments of Ogg files are stream tags in ffmpeg
+        arguments += ["-map_metadata:s:a", "0:s:a"]
+        metadata_option = "-metadata:s:a"
+    else:
+        arguments += ["-id3v2_version", "3"]
+    
+    for name, value in tags.items():
+        arguments += [metadata_option, name+"="+value]
+    
+    return arguments
+
+# Function: writeID3Gain(path, tags)
+# Arguments:
+#   - path: Path of an MP3 file
+#   - tags: Tags returned by 'getGainTags'
+# Description: Replaces the ReplayGain TXXX frames of the file by the given tags using 'rewriteID3Frames' and a temporary path only used by this converter. Returns False if the tag can't be rewritten (ID3v2.2).
+
+def writeID3Gain(path, tags):
+    temporary_path = getTemporaryPath(path, True)
+    new_frames = [(b"TXXX", buildTXXXContent(name, value)) for name, value in tags.items()]
+    
+    try:
+        rewritten = rewriteID3Frames(path, temporary_path, new_frames, lambda frame_id, content: frame_id == b"TXXX" and getTXXXDescription(content).upper() in replaygain_tags)
+    except BaseException:
+        discardOutput(path, True)
+        raise
+    
+    if rewritten:
+        commitOutput(path, True)
+    
+    return rewritten
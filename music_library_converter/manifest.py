@@ -0,0 +1,232 @@
+# coding: utf8
+
+# Music Library Converter - Manifest
+# by JoeJoeTV - 2020,2021
+# Remembers which source files were converted with which settings
+
+
+import os
+import sqlite3
+import hashlib
+import json
+
+#Variables and Constants
+#------------------------
+
+manifest_filename = ".cml_manifest.sqlite"
+
+#Functions
+#----------
+
+# Function: getSettingsKey(profile, file_type)
+# Arguments:
+#   - profile: Encode profile the file is converted with
+#   - file_type: Type of the source file ("mp3", "flac", "lrc", "cue" or "art")
+# Description: Returns a string describing all settings, which have an influence on the output for the given file type. If it differs from the one in the manifest, the file gets converted again.
+
+def getSettingsKey(profile, file_type):
+    key = profile.getSettingsKey(file_type)
+    
+    if key is None:
+        return ""
+    
+    return json.dumps(key, sort_keys=True)
+
+# Function: getUntaggedSettingsKey(settings_key)
+# Arguments:
+#   - settings_key: Settings key returned by 'getSettingsKey'
+# Description: Returns the settings key of the same profile without ReplayGain, or None if the key doesn't include ReplayGain.
+
+def getUntaggedSettingsKey(settings_key):
+    key = json.loads(settings_key) if settings_key != "" else None
+    
+    if not isinstance(key, dict) or not key.pop("replaygain", False):
+        return None
+    
+    return json.dumps(key, sort_keys=True)
+
+# Function: hashFile(path)
+# Arguments:
+#   - path: Path of the file, which should be hashed
+# Description: Returns the BLAKE2 hash of the content of the given file as a hex string.
+
+def hashFile(path):
+    filehash = hashlib.blake2b(digest_size=20)
+    
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            filehash.update(chunk)
+    
+    return filehash.hexdigest()
+
+# Function: fingerprintFile(path, size)
+# Arguments:
+#   - path: Path of the file, which should be fingerprinted
+#   - size: Size of the file
+# Description: Returns a cheap fingerprint of the file, which consists of its size and the BLAKE2 hash of its first and last 64 KiB including the tags.
+
+def fingerprintFile(path, size):
+    filehash = hashlib.blake2b(digest_size=16)
+    
+    with open(path, "rb") as f:
+        filehash.update(f.read(65536))
+        
+        if size > 131072:
+            f.seek(size - 65536)
+        
+        filehash.update(f.read(65536))
+    
+    return str(size)+"-"+filehash.hexdigest()
+
+#Classes
+#--------
+
+# Class: Manifest
+# Description: SQLite database in the destination library, which stores the state of every converted source file and the settings used. All entries are loaded into memory when the manifest is opened. Must only be used from the thread, which opened it.
+
+class Manifest:
+
+    # Method: __init__(dest_path, batch_size=100)
+    # Arguments:
+    #   - dest_path: Path of the destination library, in which the manifest is stored
+    #   - batch_size: Number of changes, which are committed together. Defaults to 100. Should be 1 if several converters share the manifest, as the database stays locked until the changes are committed.
+    # Description: Opens the manifest database in 'dest_path', creates it if necessary and loads all entries. Manifests of older versions get the missing columns added.
+
+    def __init__(self, dest_path, batch_size=100):
+        self.entries = {}
+        self.pending = 0
+        self.batch_size = batch_size
+        #Other converters may be writing to the database at the same time
+        self.connection = sqlite3.connect(os.path.join(dest_path, manifest_filename), timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (source TEXT PRIMARY KEY, destination TEXT NOT NULL, size INTEGER NOT NULL, mtime INTEGER NOT NULL, hash TEXT, settings TEXT NOT NULL, fingerprint TEXT, loudness TEXT)")
+        
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(files)")]
+        
+        for column in ("fingerprint", "loudness"):
+            if column not in columns:
+                self.connection.execute("ALTER TABLE files ADD COLUMN "+column+" TEXT")
+        
+        self.connection.commit()
+        self.entries = self.readEntries("", ())
+
+    # Method: readEntries(condition, parameters)
+    # Arguments:
+    #   - condition: SQL condition selecting the entries (e.g. "WHERE source = ?") or ""
+    #   - parameters: Parameters of the condition
+    # Description: Reads the entries from the manifest database and returns them by the path of their source file.
+
+    def readEntries(self, condition, parameters):
+        entries = {}
+        
+        for source, destination, size, mtime, filehash, job_settings, fingerprint, loudness in self.connection.execute("SELECT source, destination, size, mtime, hash, settings, fingerprint, loudness FROM files "+condition, parameters):
+            entries[source] = {
+                "destination": destination,
+                "size": size,
+                "mtime": mtime,
+                "hash": filehash,
+                "settings": job_settings,
+                "fingerprint": fingerprint,
+                "loudness": json.loads(loudness) if loudness else None
+            }
+        
+        return entries
+
+    # Method: readDirectory(directory)
+    # Arguments:
+    #   - directory: Path of a directory relative to the source library
+    # Description: Reads the entries of the source files directly inside of the directory from the manifest database, which includes the entries written by other converters sharing the manifest.
+
+    def readDirectory(self, directory):
+        if directory == "":
+            entries = self.readEntries("", ())
+        else:
+            #All paths starting with the directory are sorted between these two
+            entries = self.readEntries("WHERE source >= ? AND source < ?", (directory+os.sep, directory+os.sep+"\U0010ffff"))
+        
+        return {source: entry for source, entry in entries.items() if os.path.dirname(source) == directory}
+
+    # Method: close()
+    # Description: Writes all pending changes to the manifest database and closes it.
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    # Method: record(job)
+    # Arguments:
+    #   - job: Job, whose source file was successfully converted or copied
+    # Description: Stores the state of the source file of 'job', the settings used and the loudness of the file, if it was measured. Changes are committed in batches of 'batch_size' entries.
+
+    def record(self, job):
+        entry = {
+            "destination": job.destination_key,
+            "size": job.size,
+            "mtime": job.mtime,
+            "hash": job.hash,
+            "settings": job.settings_key,
+            "fingerprint": job.fingerprint,
+            "loudness": job.loudness
+        }
+        self.entries[job.manifest_key] = entry
+        self.connection.execute("INSERT OR REPLACE INTO files (source, destination, size, mtime, hash, settings, fingerprint, loudness) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (job.manifest_key, entry["destination"], entry["size"], entry["mtime"], entry["hash"], entry["settings"], entry["fingerprint"], json.dumps(job.loudness) if job.loudness is not None else None))
+        self.commitBatch()
+
+    # Method: remove(key)
+    # Arguments:
+    #   - key: Path of a source file relative to the source library
+    # Description: Removes the entry of a source file, whose output was moved or deleted.
+
+    def remove(self, key):
+        if self.entries.pop(key, None) is None:
+            return
+        
+        self.connection.execute("DELETE FROM files WHERE source = ?", (key,))
+        self.commitBatch()
+
+    # Method: commit()
+    # Description: Writes all pending changes to the manifest database.
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    # Method: commitBatch()
+    # Description: Counts a change and commits all pending changes, once there are 'batch_size' of them.
+
+    def commitBatch(self):
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.connection.commit()
+            self.pending = 0
+
+    # Method: check(job, hash_sources=False)
+    # Arguments:
+    #   - job: Job created by 'planLibrary', including the state of the source file
+    #   - hash_sources: If the content hash should be compared, when the modification time changed. Defaults to False.
+    # Description: Compares the source file of 'job' with its manifest entry. Returns "new" if there is no entry, "unchanged" if neither the file nor the settings changed, "touched" if only the modification time changed but the content hash is still the same, "untagged" if the file didn't change, but ReplayGain was enabled for its profile since, and "changed" otherwise.
+
+    def check(self, job, hash_sources=False):
+        entry = self.entries.get(job.manifest_key)
+        
+        if entry is None:
+            return "new"
+        
+        untagged = entry["settings"] != job.settings_key
+        
+        if entry["destination"] != job.destination_key or (untagged and entry["settings"] != getUntaggedSettingsKey(job.settings_key)):
+            return "changed"
+        
+        if entry["size"] == job.size and entry["mtime"] == job.mtime:
+            return "untagged" if untagged else "unchanged"
+        
+        #Only compare the content, if the size is still the same
+        if hash_sources and entry["hash"] and entry["size"] == job.size:
+            if job.hash is None:
+                job.hash = hashFile(job.source)
+            
+            if job.hash == entry["hash"]:
+                return "untagged" if untagged else "touched"
+        
+        return "changed"
@@ -0,0 +1,492 @@
+# coding: utf8
+
+# Music Library Converter - Metadata
+# by JoeJoeTV - 2020,2021
+# Reads tags, embedded pictures and stream information of MP3 and FLAC files and rewrites ID3v2 tags
+
+
+import os
+import struct
+import zlib
+
+from .files import copyFileData
+
+#Variables and Constants
+#------------------------
+
+#Names of the tags read from ID3v2 frames (including the ones of ID3v2.2) and Vorbis comments
+id3_tag_names = {
+    b"TIT2": "title", b"TT2": "title",
+    b"TPE1": "artist", b"TP1": "artist",
+    b"TALB": "album", b"TAL": "album",
+    b"TPE2": "albumartist", b"TP2": "albumartist",
+    b"TRCK": "tracknumber", b"TRK": "tracknumber",
+    b"TPOS": "discnumber", b"TPA": "discnumber",
+    b"TDRC": "date", b"TYER": "date", b"TYE": "date",
+    b"TCON": "genre", b"TCO": "genre"
+}
+vorbis_tag_names = {
+    "title": "title",
+    "artist": "artist",
+    "album": "album",
+    "albumartist": "albumartist",
+    "album artist": "albumartist",
+    "tracknumber": "tracknumber",
+    "discnumber": "discnumber",
+    "date": "date",
+    "year": "date",
+    "genre": "genre"
+}
+
+#Functions
+#----------
+
+# Function: syncsafeInt(data)
+# Arguments:
+#   - data: Bytes of a syncsafe integer, like they are used in ID3v2 tags
+# Description: Decodes a syncsafe integer, of which only the lower 7 bits of every byte are used.
+
+def syncsafeInt(data):
+    value = 0
+    
+    for byte in data:
+        value = (value << 7) | (byte & 0x7f)
+    
+    return value
+
+# Function: skipID3String(data, pos, encoding)
+# Arguments:
+#   - data: Content of an ID3v2 frame
+#   - pos: Position of the start of a null-terminated string inside of 'data'
+#   - encoding: Text encoding byte of the frame
+# Description: Returns the position after the null-terminated string starting at 'pos'. UTF-16 strings are terminated by two null bytes.
+
+def skipID3String(data, pos, encoding):
+    if encoding in (1, 2):
+        end = pos
+        
+        while end + 1 < len(data) and data[end:end+2] != b"\x00\x00":
+            end += 2
+        
+        return end + 2
+    else:
+        return data.index(b"\x00", pos) + 1
+
+# Function: getID3FrameContent(major_version, tag_flags, frame_flags, content)
+# Arguments:
+#   - major_version: Major version of the ID3v2 tag (2, 3 or 4)
+#   - tag_flags: Flags of the tag header
+#   - frame_flags: Flags of the frame header
+#   - content: Raw content of the frame
+# Description: Removes compression, unsynchronisation and additional header data from the frame content. Returns None for encrypted frames.
+
+def getID3FrameContent(major_version, tag_flags, frame_flags, content):
+    if major_version == 3:
+        if frame_flags & 0x0040:
+            return None
+        if frame_flags & 0x0080:
+            content = zlib.decompress(content[4:])
+        elif frame_flags & 0x0020:
+            content = content[1:]
+    elif major_version == 4:
+        if frame_flags & 0x0004:
+            return None
+        if frame_flags & 0x0040:
+            content = content[1:]
+        if frame_flags & 0x0001:
+            content = content[4:]
+        if (frame_flags & 0x0002) or (tag_flags & 0x80):
+            content = content.replace(b"\xff\x00", b"\xff")
+        if frame_flags & 0x0008:
+            content = zlib.decompress(content)
+    
+    return content
+
+# Function: decodeID3Text(data, encoding)
+# Arguments:
+#   - data: Encoded text of an ID3v2 frame
+#   - encoding: Text encoding byte of the frame
+# Description: Decodes the text of an ID3v2 text frame. Multiple values (ID3v2.4) are joined using "; ".
+
+def decodeID3Text(data, encoding):
+    if encoding == 1:
+        text = data.decode("utf-16", "replace")
+    elif encoding == 2:
+        text = data.decode("utf-16-be", "replace")
+    elif encoding == 3:
+        text = data.decode("utf-8", "replace")
+    else:
+        text = data.decode("latin-1")
+    
+    return "; ".join(value for value in text.split("\x00") if value != "")
+
+# Function: getImageInfo(data)
+# Arguments:
+#   - data: Content of an image file
+# Description: Returns the format ("JPEG", "PNG", "GIF", "BMP" or "") as well as the width and height of the image, by only reading its header. Width and height are 0 if they could not be determined.
+
+def getImageInfo(data):
+    if data[0:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return "PNG", width, height
+    elif data[0:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return "GIF", width, height
+    elif data[0:2] == b"BM" and len(data) >= 26:
+        width, height = struct.unpack("<ii", data[18:26])
+        return "BMP", width, abs(height)
+    elif data[0:2] == b"\xff\xd8":
+        pos = 2
+        
+        #Walk through the markers until the start of frame marker, which contains the dimensions
+        while pos + 4 <= len(data):
+            if data[pos] != 0xff:
+                break
+            
+            marker = data[pos+1]
+            
+            if marker == 0xff:
+                pos += 1
+                continue
+            
+            segment_length = struct.unpack(">H", data[pos+2:pos+4])[0]
+            
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc) and pos + 9 <= len(data):
+                height, width = struct.unpack(">HH", data[pos+5:pos+9])
+                return "JPEG", width, height
+            
+            pos += 2 + segment_length
+        
+        return "JPEG", 0, 0
+    else:
+        return "", 0, 0
+
+# Function: readID3Frames(f)
+# Arguments:
+#   - f: File object of an audio file, positioned at the start of an ID3v2 tag
+# Description: Reads the ID3v2 tag at the current position of 'f' and splits it into its frames. Returns a dictionary containing the major version, the tag flags, the total length of the tag and a list of frames, each consisting of its ID, its flags and its raw content. Returns None if there is no supported tag.
+
+def readID3Frames(f):
+    header = f.read(10)
+    
+    if len(header) < 10 or header[0:3] != b"ID3" or header[3] not in (2, 3, 4):
+        return None
+    
+    major_version = header[3]
+    tag_flags = header[5]
+    tag_size = syncsafeInt(header[6:10])
+    data = f.read(tag_size)
+    
+    #Before version 2.4, unsynchronisation is applied to the whole tag
+    if major_version < 4 and tag_flags & 0x80:
+        data = data.replace(b"\xff\x00", b"\xff")
+    
+    pos = 0
+    
+    #Skip the extended header
+    if major_version >= 3 and tag_flags & 0x40:
+        if major_version == 3:
+            pos = 4 + struct.unpack(">I", data[0:4])[0]
+        else:
+            pos = syncsafeInt(data[0:4])
+    
+    frame_header_length = 6 if major_version == 2 else 10
+    frames = []
+    
+    while pos + frame_header_length <= len(data):
+        if major_version == 2:
+            frame_id = data[pos:pos+3]
+            frame_size = int.from_bytes(data[pos+3:pos+6], "big")
+            frame_flags = 0
+        else:
+            frame_id = data[pos:pos+4]
+            frame_size = syncsafeInt(data[pos+4:pos+8]) if major_version == 4 else struct.unpack(">I", data[pos+4:pos+8])[0]
+            frame_flags = struct.unpack(">H", data[pos+8:pos+10])[0]
+        
+        #Padding after the last frame
+        if frame_id[0] == 0:
+            break
+        
+        frames.append((frame_id, frame_flags, data[pos+frame_header_length:pos+frame_header_length+frame_size]))
+        pos += frame_header_length + frame_size
+    
+    return {
+        "major_version": major_version,
+        "flags": tag_flags,
+        "length": 10 + tag_size + (10 if major_version == 4 and tag_flags & 0x10 else 0),
+        "frames": frames
+    }
+
+# Function: readID3Tag(f)
+# Arguments:
+#   - f: File object of an audio file, positioned at the start of an ID3v2 tag
+# Description: Reads the ID3v2 tag at the current position of 'f' and returns its main text tags and all embedded pictures (APIC/PIC frames). The audio data after the tag is not read.
+
+def readID3Tag(f):
+    metadata = {"tags": {}, "pictures": []}
+    tag = readID3Frames(f)
+    
+    if tag is None:
+        return metadata
+    
+    for frame_id, frame_flags, content in tag["frames"]:
+        if frame_id not in id3_tag_names and frame_id not in (b"APIC", b"PIC"):
+            continue
+        
+        content = getID3FrameContent(tag["major_version"], tag["flags"], frame_flags, content)
+        
+        if not content:
+            continue
+        
+        encoding = content[0]
+        
+        if frame_id in id3_tag_names:
+            metadata["tags"].setdefault(id3_tag_names[frame_id], decodeID3Text(content[1:], encoding))
+            continue
+        
+        if frame_id == b"PIC":
+            mime = {"JPG": "image/jpeg", "PNG": "image/png"}.get(content[1:4].decode("latin-1").upper(), "")
+            content_pos = 4
+        else:
+            content_pos = content.index(b"\x00", 1)
+            mime = content[1:content_pos].decode("latin-1")
+            content_pos += 1
+        
+        picture_type = content[content_pos]
+        content_pos = skipID3String(content, content_pos + 1, encoding)
+        
+        metadata["pictures"].append({"type": picture_type, "mime": mime, "width": 0, "height": 0, "data": content[content_pos:]})
+    
+    return metadata
+
+# Function: readFLACMetadata(f)
+# Arguments:
+#   - f: File object of a FLAC file, positioned at the start of the file
+# Description: Reads the metadata blocks of the FLAC file and returns its stream information (STREAMINFO), its tags (VORBIS_COMMENT) and all embedded pictures (PICTURE). Other blocks and the audio data are skipped.
+
+def readFLACMetadata(f):
+    metadata = {"tags": {}, "pictures": [], "streaminfo": None}
+    magic = f.read(4)
+    
+    #Some FLAC files start with an ID3v2 tag, which is skipped
+    if magic[0:3] == b"ID3":
+        header = magic + f.read(6)
+        f.seek(10 + syncsafeInt(header[6:10]) + (10 if header[5] & 0x10 else 0))
+        magic = f.read(4)
+    
+    if magic != b"fLaC":
+        return metadata
+    
+    last_block = False
+    
+    while not last_block:
+        block_header = f.read(4)
+        
+        if len(block_header) < 4:
+            break
+        
+        last_block = bool(block_header[0] & 0x80)
+        block_type = block_header[0] & 0x7f
+        block_length = int.from_bytes(block_header[1:4], "big")
+        
+        if block_type not in (0, 4, 6):
+            f.seek(block_length, os.SEEK_CUR)
+            continue
+        
+        block = f.read(block_length)
+        
+        if block_type == 0:
+            #Sample rate (20 bits), channels (3 bits), bits per sample (5 bits) and total samples (36 bits) are packed into 8 bytes
+            packed = int.from_bytes(block[10:18], "big")
+            metadata["streaminfo"] = {
+                "sample_rate": packed >> 44,
+                "channels": ((packed >> 41) & 0x07) + 1,
+                "bits_per_sample": ((packed >> 36) & 0x1f) + 1,
+                "total_samples": packed & 0xfffffffff,
+                "md5": block[18:34].hex()
+            }
+        elif block_type == 4:
+            vendor_length = struct.unpack("<I", block[0:4])[0]
+            pos = 4 + vendor_length
+            comment_count = struct.unpack("<I", block[pos:pos+4])[0]
+            pos += 4
+            
+            for i in range(comment_count):
+                comment_length = struct.unpack("<I", block[pos:pos+4])[0]
+                comment = block[pos+4:pos+4+comment_length].decode("utf-8", "replace")
+                pos += 4 + comment_length
+                
+                key, separator, value = comment.partition("=")
+                key = key.lower()
+                
+                if separator != "" and key in vorbis_tag_names:
+                    metadata["tags"].setdefault(vorbis_tag_names[key], value)
+        else:
+            picture_type, mime_length = struct.unpack(">II", block[0:8])
+            mime = block[8:8+mime_length].decode("ascii", "replace")
+            pos = 8 + mime_length
+            description_length = struct.unpack(">I", block[pos:pos+4])[0]
+            pos += 4 + description_length
+            width, height, depth, colors, data_length = struct.unpack(">IIIII", block[pos:pos+20])
+            pos += 20
+            
+            metadata["pictures"].append({"type": picture_type, "mime": mime, "width": width, "height": height, "data": block[pos:pos+data_length]})
+    
+    return metadata
+
+# Function: readAudioFileMetadata(audio_file)
+# Arguments:
+#   - audio_file: Path to an MP3 or FLAC file
+# Description: Reads the tags, the embedded pictures and (for FLAC files) the stream information of 'audio_file' directly from the file header, without starting another process. Additionally selects the cover, preferring the front cover over other pictures, and determines its format and dimensions. 'cover' is None if the file has no cover.
+
+def readAudioFileMetadata(audio_file):
+    with open(audio_file, "rb") as f:
+        if os.path.splitext(audio_file)[1].lower() == ".flac":
+            metadata = readFLACMetadata(f)
+        else:
+            metadata = readID3Tag(f)
+            metadata["streaminfo"] = None
+    
+    #Pictures can also be links to an external file
+    pictures = [picture for picture in metadata["pictures"] if picture["mime"] != "-->" and len(picture["data"]) > 0]
+    metadata["cover"] = None
+    
+    for picture in pictures:
+        if picture["type"] == 3:
+            metadata["cover"] = picture
+            break
+    else:
+        if len(pictures) > 0:
+            metadata["cover"] = pictures[0]
+    
+    if metadata["cover"] is not None:
+        cover = metadata["cover"]
+        cover["format"], width, height = getImageInfo(cover["data"])
+        
+        #The dimensions stored in FLAC files are not always set
+        if cover["width"] == 0 or cover["height"] == 0:
+            cover["width"] = width
+            cover["height"] = height
+    
+    return metadata
+
+# Function: syncsafeBytes(value)
+# Arguments:
+#   - value: Integer smaller than 2^28
+# Description: Encodes an integer as a 4 byte syncsafe integer, like they are used in ID3v2 tags.
+
+def syncsafeBytes(value):
+    return bytes([(value >> 21) & 0x7f, (value >> 14) & 0x7f, (value >> 7) & 0x7f, value & 0x7f])
+
+# Function: buildID3Frame(major_version, frame_id, frame_flags, content)
+# Arguments:
+#   - major_version: Major version of the ID3v2 tag (3 or 4)
+#   - frame_id: ID of the frame
+#   - frame_flags: Flags of the frame
+#   - content: Raw content of the frame
+# Description: Returns the frame including its frame header.
+
+def buildID3Frame(major_version, frame_id, frame_flags, content):
+    if major_version == 4:
+        size = syncsafeBytes(len(content))
+    else:
+        size = struct.pack(">I", len(content))
+    
+    return frame_id + size + struct.pack(">H", frame_flags) + content
+
+# Function: getTXXXDescription(content)
+# Arguments:
+#   - content: Content of a TXXX frame (user defined text), as returned by 'getID3FrameContent'
+# Description: Returns the description of the frame, which names the stored value. Returns "" if the frame is invalid.
+
+def getTXXXDescription(content):
+    if not content:
+        return ""
+    
+    encoding = content[0]
+    
+    try:
+        end = skipID3String(content, 1, encoding)
+    except ValueError:
+        return ""
+    
+    return decodeID3Text(content[1:end - (2 if encoding in (1, 2) else 1)], encoding)
+
+# Function: buildTXXXContent(description, value)
+# Arguments:
+#   - description: Name of the value
+#   - value: Text, which only contains ASCII characters
+# Description: Returns the content of a TXXX frame (user defined text) storing the value, which is valid in ID3v2.3 and ID3v2.4.
+
+def buildTXXXContent(description, value):
+    return b"\x00"+description.encode("latin-1")+b"\x00"+value.encode("latin-1")
+
+# Function: rewriteID3Frames(source, destination, new_frames, replaced)
+# Arguments:
+#   - source: Path of an MP3 file
+#   - destination: Path of the new MP3 file
+#   - new_frames: List of frames added to the tag, each consisting of its ID and its content
+#   - replaced: Function called with the ID and the content (see 'getID3FrameContent', None if it can't be read) of every existing frame, which returns True if the frame should be removed
+# Description: Writes a copy of the MP3 file with a new ID3v2 tag, in which the replaced frames are removed and the new frames are added. Only the tag is written, while the audio data is copied unchanged using 'copyFileData'. Returns False if the tag can't be rewritten (ID3v2.2), in which case nothing is written.
+
+def rewriteID3Frames(source, destination, new_frames, replaced):
+    with open(source, "rb") as f:
+        tag = readID3Frames(f)
+        source_size = os.fstat(f.fileno()).st_size
+    
+    if tag is None:
+        tag = {"major_version": 3, "flags": 0, "length": 0, "frames": []}
+    elif tag["major_version"] == 2:
+        return False
+    
+    major_version = tag["major_version"]
+    
+    frames = []
+    
+    #Keep all other frames as they are
+    for frame_id, frame_flags, content in tag["frames"]:
+        try:
+            frame_content = getID3FrameContent(major_version, tag["flags"], frame_flags, content)
+        except zlib.error:
+            frame_content = None
+        
+        if not replaced(frame_id, frame_content):
+            #In version 2.4, the unsynchronisation of the whole tag is kept on every frame, since the new tag header doesn't set it
+            if major_version == 4 and tag["flags"] & 0x80:
+                frame_flags |= 0x0002
+            
+            frames.append(buildID3Frame(major_version, frame_id, frame_flags, content))
+    
+    frames += [buildID3Frame(major_version, frame_id, 0, content) for frame_id, content in new_frames]
+    
+    tag_data = b"".join(frames)
+    header = b"ID3"+bytes([major_version, 0, 0])+syncsafeBytes(len(tag_data))
+    
+    binary_flag = getattr(os, "O_BINARY", 0)
+    source_fd = os.open(source, os.O_RDONLY | binary_flag)
+    
+    try:
+        destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | binary_flag, 0o666)
+        
+        try:
+            os.write(destination_fd, header+tag_data)
+            copyFileData(source_fd, destination_fd, tag["length"], len(header) + len(tag_data), source_size - tag["length"])
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+    
+    return True
+
+# Function: rewriteID3Cover(source, destination, cover_data)
+# Arguments:
+#   - source: Path of an MP3 file
+#   - destination: Path of the new MP3 file
+#   - cover_data: Content of the new cover
+# Description: Writes a copy of the MP3 file, in which all embedded pictures are replaced by the new cover as the front cover, using 'rewriteID3Frames'. Returns False if the tag can't be rewritten (ID3v2.2), in which case nothing is written.
+
+def rewriteID3Cover(source, destination, cover_data):
+    cover_format = getImageInfo(cover_data)[0]
+    mime = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "BMP": "image/bmp"}.get(cover_format, "image/")
+    
+    return rewriteID3Frames(source, destination, [(b"APIC", b"\x00"+mime.encode("latin-1")+b"\x00\x03\x00"+cover_data)], lambda frame_id, content: frame_id == b"APIC")
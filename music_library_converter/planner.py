@@ -0,0 +1,300 @@
+# coding: utf8
+
+# Music Library Converter - Planner
+# by JoeJoeTV - 2020,2021
+# Scans the source library and decides what has to be done for every file
+
+
+import os
+import logging
+
+from .jobs import ConversionJob, job_types
+from .manifest import getSettingsKey, fingerprintFile
+
+#Variables and Constants
+#------------------------
+
+logger = logging.getLogger(__name__)
+#Companion files, which are copied along with the audio file of the same name, and the setting enabling them
+sidecar_types = {
+    "lrc": "copy_lyrics",
+    "cue": "copy_cue"
+}
+#Names of folder art images without file extension
+folder_art_names = ("folder", "cover", "front", "album")
+
+#Functions
+#----------
+
+# Function: destinationExists(path, listings)
+# Arguments:
+#   - path: Path of a file in the destination library
+#   - listings: Dictionary used to cache the contents of destination directories
+# Description: Checks if the given file exists. Every destination directory is only listed once instead of checking every file separately.
+
+def destinationExists(path, listings):
+    directory, filename = os.path.split(path)
+    
+    if directory not in listings:
+        try:
+            listings[directory] = set(os.listdir(directory))
+        except OSError:
+            listings[directory] = set()
+    
+    return filename in listings[directory]
+
+# Function: scanDirectories(path)
+# Arguments:
+#   - path: Path of the directory, which should be scanned
+# Description: Recurses through all subdirectories of 'path' using 'os.scandir' and yields every directory together with the entries of the files inside of it. Symbolic links to directories are not followed.
+
+def scanDirectories(path):
+    directories = [path]
+    
+    while len(directories) > 0:
+        directory = directories.pop()
+        file_entries = []
+        subdirectories = []
+        
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        file_entries.append(entry)
+        except OSError as err:
+            logger.warning("Could not scan directory "+directory+": "+str(err))
+            continue
+        
+        file_entries.sort(key=lambda entry: entry.name)
+        yield directory, file_entries
+        
+        #Reversed, so the subdirectories are scanned in alphabetical order
+        directories.extend(sorted(subdirectories, reverse=True))
+
+# Function: indexDirectory(entries, settings)
+# Arguments:
+#   - entries: Entries of the files in a directory, as yielded by 'scanDirectories'
+#   - settings: Settings of the converter
+# Description: Matches the audio files of a directory with their companion files by name, ignoring case. Returns the entries, which should be converted or copied, together with their job type.
+
+def indexDirectory(entries, settings):
+    audio_names = set()
+    files = []
+    
+    for entry in entries:
+        name, extension = os.path.splitext(entry.name)
+        file_type = job_types.get(extension.lower())
+        
+        if file_type in ("mp3", "flac"):
+            audio_names.add(name.lower())
+            files.append((entry, file_type))
+    
+    if len(audio_names) == 0:
+        return files
+    
+    for entry in entries:
+        name, extension = os.path.splitext(entry.name)
+        file_type = job_types.get(extension.lower())
+        
+        if file_type in sidecar_types:
+            if settings[sidecar_types[file_type]] and name.lower() in audio_names:
+                files.append((entry, file_type))
+        elif file_type == "art":
+            if settings["copy_folder_art"] and name.lower() in folder_art_names:
+                files.append((entry, file_type))
+    
+    files.sort(key=lambda item: item[0].name)
+    return files
+
+# Function: prepareJob(job, source_path, settings, manifest, listings)
+# Arguments:
+#   - job: Job of type "mp3", "flac", "lrc", "cue" or "art"
+#   - source_path: Path of the source library
+#   - settings: Settings of the converter
+#   - manifest: Opened manifest of the destination library of the job's profile or None
+#   - listings: Dictionary used to cache the contents of destination directories
+# Description: Compares the job with the manifest (or checks if its destination exists, if there is no manifest) and changes its type to "exists", if the file doesn't have to be converted or copied again, or to "gain", if only the ReplayGain tags have to be added to its existing output. Returns the state returned by 'Manifest.check' or None if there is no manifest. Unchanged files keep the loudness stored in the manifest and, in mirror mode, are recorded again, if their manifest entry has no fingerprint yet.
+
+def prepareJob(job, source_path, settings, manifest, listings):
+    if manifest is not None:
+        job.manifest_key = os.path.relpath(job.source, source_path)
+        job.destination_key = os.path.relpath(job.destination, job.profile.destination)
+        job.settings_key = getSettingsKey(job.profile, job.type)
+        job.record = True
+        
+        state = manifest.check(job, settings["hash_sources"])
+        
+        if state == "unchanged":
+            job.type = "exists"
+            job.loudness = manifest.entries[job.manifest_key]["loudness"]
+            job.record = settings["mirror"] and manifest.entries[job.manifest_key]["fingerprint"] is None
+            return state
+        elif state == "touched":
+            job.type = "exists"
+            job.loudness = manifest.entries[job.manifest_key]["loudness"]
+            return state
+        elif state == "untagged":
+            #Only the ReplayGain tags are added to the existing output, which is converted again if it is missing
+            if os.path.exists(job.destination):
+                job.type = "gain"
+            return state
+        elif state == "changed":
+            #Replace the outdated file
+            return state
+    else:
+        state = None
+    
+    #Check if file with new filename already exists
+    if destinationExists(job.destination, listings):
+        job.type = "exists"
+    
+    return state
+
+# Function: getDestinationPath(relpath, file_type, profile)
+# Arguments:
+#   - relpath: Path of the source file relative to the source library
+#   - file_type: Type of the source file ("mp3", "flac", "lrc", "cue" or "art")
+#   - profile: Encode profile the file is converted with
+# Description: Returns the path of the converted or copied file in the destination library of the profile. Only converted FLAC files and folder art converted to JPEG get a new file extension.
+
+def getDestinationPath(relpath, file_type, profile):
+    name, extension = os.path.splitext(relpath)
+    
+    if file_type == "flac":
+        relpath = name+profile.getExtension()
+    elif file_type == "art" and profile.convert_cover and extension.lower() not in (".jpg", ".jpeg"):
+        relpath = name+".jpg"
+    
+    return os.path.join(profile.destination, relpath)
+
+# Function: detectMoves(jobs, new_jobs, source_path, profiles, settings, manifests, claimed_destinations, removed_keys=None)
+# Arguments:
+#   - jobs: All jobs planned for the source library
+#   - new_jobs: Jobs of source files without manifest entry, which have to be converted or copied
+#   - source_path: Path of the source library
+#   - profiles: Encode profiles, each with its own destination library
+#   - settings: Settings of the converter
+#   - manifests: Opened manifests of the destination libraries by profile name
+#   - claimed_destinations: Set of all destination paths used by 'jobs'
+#   - removed_keys: Manifest keys of source files, which were removed. Defaults to None, in which case all manifest entries are checked.
+# Description: Matches manifest entries of source files, which no longer exist, with new source files with the same fingerprint and settings, which get jobs of type "move". If 'delete_orphans' is set, returns jobs of type "delete" for the outputs of the remaining orphaned entries.
+
+def detectMoves(jobs, new_jobs, source_path, profiles, settings, manifests, claimed_destinations, removed_keys=None):
+    seen_keys = set(job.manifest_key for job in jobs if job.manifest_key is not None)
+    fingerprints = {}
+    delete_jobs = []
+    
+    for profile in profiles:
+        manifest = manifests.get(profile.name)
+        
+        if manifest is None:
+            continue
+        
+        orphan_keys = []
+        orphans = {}
+        
+        for key in (manifest.entries if removed_keys is None else removed_keys):
+            entry = manifest.entries.get(key)
+            
+            #Files skipped by this run (e.g. LRC files without '--copy-lyrics') still exist
+            if entry is None or key in seen_keys or os.path.lexists(os.path.join(source_path, key)):
+                continue
+            
+            orphan_keys.append(key)
+            
+            if entry["fingerprint"] is not None:
+                orphans.setdefault((entry["fingerprint"], entry["settings"]), []).append(key)
+        
+        moved_keys = set()
+        
+        if len(orphans) > 0:
+            for job in new_jobs:
+                if job.profile is not profile:
+                    continue
+                
+                #The source file is only fingerprinted once for all profiles
+                if job.source not in fingerprints:
+                    try:
+                        fingerprints[job.source] = fingerprintFile(job.source, job.size)
+                    except OSError as err:
+                        logger.warning("Could not fingerprint "+job.source+": "+str(err))
+                        fingerprints[job.source] = None
+                
+                job.fingerprint = fingerprints[job.source]
+                matches = orphans.get((job.fingerprint, job.settings_key))
+                
+                if not matches:
+                    continue
+                
+                key = matches.pop(0)
+                moved_keys.add(key)
+                job.previous_key = key
+                job.loudness = manifest.entries[key]["loudness"]
+                previous_destination = os.path.join(profile.destination, manifest.entries[key]["destination"])
+                
+                #If the old output is gone, the file is converted again, but the old entry is still replaced
+                if os.path.exists(previous_destination):
+                    job.type = "move"
+                    job.previous_destination = previous_destination
+        
+        if settings["delete_orphans"]:
+            for key in orphan_keys:
+                entry = manifest.entries[key]
+                destination = os.path.join(profile.destination, entry["destination"])
+                
+                if key in moved_keys or destination in claimed_destinations:
+                    continue
+                
+                delete_jobs.append(ConversionJob("delete", os.path.join(source_path, key), destination, 0, entry["mtime"], profile, previous_key=key))
+    
+    #Keep the jobs of the same source file together, in the order of the profiles
+    delete_jobs.sort(key=lambda job: job.source)
+    return delete_jobs
+
+# Function: planLibrary(source_path, profiles, settings, manifests={})
+# Arguments:
+#   - source_path: Path of the source library
+#   - profiles: Encode profiles, each with its own destination library
+#   - settings: Settings of the converter
+#   - manifests: Opened manifests of the destination libraries by profile name. Defaults to {}, in which case only existing destination files are skipped.
+# Description: Scans all subdirectories of 'source_path' and returns the list of jobs for every file and profile, which should be converted or copied, as selected by 'indexDirectory'. The jobs of a file follow each other in the order of the profiles. Files, which already exist in the destination, get jobs of type "exists". In mirror mode, moved files get jobs of type "move" and orphaned outputs jobs of type "delete" at the end of the list, as described in 'detectMoves'.
+
+def planLibrary(source_path, profiles, settings, manifests={}):
+    jobs = []
+    new_jobs = []
+    listings = {}
+    claimed_destinations = set()
+    
+    for root, entries in scanDirectories(source_path):
+        for entry, file_type in indexDirectory(entries, settings):
+            relpath = os.path.relpath(entry.path, source_path)
+            source_stat = entry.stat()
+            filehash = None
+            
+            for profile in profiles:
+                newfilepath = getDestinationPath(relpath, file_type, profile)
+                job = ConversionJob(file_type, entry.path, newfilepath, source_stat.st_size, source_stat.st_mtime_ns, profile)
+                jobs.append(job)
+                
+                #The source file is only hashed once for all profiles
+                job.hash = filehash
+                
+                #Another file of this run already has the same destination (e.g. 'song.mp3' and 'song.flac')
+                if newfilepath in claimed_destinations:
+                    job.type = "exists"
+                    job.shadowed = True
+                    continue
+                
+                claimed_destinations.add(newfilepath)
+                state = prepareJob(job, source_path, settings, manifests.get(profile.name), listings)
+                filehash = job.hash
+                
+                if state == "new" and job.type != "exists":
+                    new_jobs.append(job)
+    
+    if settings["mirror"]:
+        jobs += detectMoves(jobs, new_jobs, source_path, profiles, settings, manifests, claimed_destinations)
+    
+    return jobs
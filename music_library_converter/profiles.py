@@ -0,0 +1,230 @@
+# coding: utf8
+
+# Music Library Converter - Encode Profiles
+# by JoeJoeTV - 2020,2021
+# Output formats and destination libraries, of which several can be produced in the same run
+
+
+import os
+import re
+import dataclasses
+
+#Variables and Constants
+#------------------------
+
+#File extension, ffmpeg encoder, default bitrate and if embedded covers are written for every output codec. Covers can't be embedded into Ogg files by ffmpeg, so Opus files only get the tags.
+codecs = {
+    "mp3": {"extension": ".mp3", "encoder": "mp3", "bitrate": "320k", "covers": True},
+    "opus": {"extension": ".opus", "encoder": "libopus", "bitrate": "128k", "covers": False}
+}
+bitrate_modes = ("cbr", "vbr")
+#Values of boolean profile options. Options without a value are enabled.
+boolean_values = {"": True, "true": True, "1": True, "yes": True, "false": False, "0": False, "no": False}
+bitrate_format = re.compile(r"^[0-9]+k$")
+
+#Classes
+#--------
+
+# Class: EncodeProfile
+# Description: Describes one destination library: the codec FLAC files are encoded to, the bitrate mode, the bitrate or MP3 VBR quality, the cover and ReplayGain settings and the destination path. MP3 sources are copied as they are.
+
+@dataclasses.dataclass
+class EncodeProfile:
+    name: str = "default"
+    destination: str = None
+    codec: str = "mp3"
+    mode: str = "cbr"
+    bitrate: str = "320k"
+    quality: int = 2
+    convert_cover: bool = False
+    cover_size: int = 0
+    replaygain: bool = False
+
+    # Method: getExtension()
+    # Description: Returns the file extension of converted FLAC files.
+
+    def getExtension(self):
+        return codecs[self.codec]["extension"]
+
+    # Method: embedsCovers()
+    # Description: Checks if converted files of this profile contain the cover.
+
+    def embedsCovers(self):
+        return codecs[self.codec]["covers"]
+
+    # Method: processesCovers()
+    # Description: Checks if embedded covers have to be converted or scaled for this profile.
+
+    def processesCovers(self):
+        return self.convert_cover or self.cover_size > 0
+
+    # Method: getEncoderArguments()
+    # Description: Returns the ffmpeg arguments selecting the encoder and the bitrate of an output.
+
+    def getEncoderArguments(self):
+        arguments = ["-c:a", codecs[self.codec]["encoder"]]
+        
+        if self.codec == "mp3":
+            if self.mode == "vbr":
+                arguments += ["-q:a", str(self.quality)]
+            else:
+                arguments += ["-b:a", self.bitrate]
+        elif self.codec == "opus":
+            arguments += ["-b:a", self.bitrate, "-vbr", "on" if self.mode == "vbr" else "off"]
+        
+        return arguments
+
+    # Method: getMuxerArguments()
+    # Description: Returns the ffmpeg arguments for the container of an output. VBR MP3 files keep their Xing header, as players need it to determine the duration.
+
+    def getMuxerArguments(self):
+        if self.codec == "mp3":
+            if self.mode == "vbr":
+                return ["-id3v2_version", "3"]
+            else:
+                return ["-id3v2_version", "3", "-write_xing", "0"]
+        
+        return []
+
+    # Method: getSettingsKey(file_type)
+    # Arguments:
+    #   - file_type: Type of the source file ("mp3", "flac", "lrc", "cue" or "art")
+    # Description: Returns a dictionary of all settings, which have an influence on the output for the given file type. The default MP3 CBR profile results in the same keys as versions without profiles.
+
+    def getSettingsKey(self, file_type):
+        if file_type == "lrc":
+            return None
+        
+        if file_type == "cue":
+            return {"extension": self.getExtension()}
+        
+        key = {
+            "convert_cover": self.convert_cover,
+            "cover_scale": self.cover_size
+        }
+        
+        #Profiles without ReplayGain keep the keys of older versions
+        if self.replaygain and file_type in ("mp3", "flac"):
+            key["replaygain"] = True
+        
+        if file_type == "flac":
+            if self.codec == "mp3" and self.mode == "cbr":
+                key["bitrate"] = self.bitrate
+            else:
+                key["codec"] = self.codec
+                key["mode"] = self.mode
+                key["bitrate"] = self.bitrate if self.codec != "mp3" else None
+                key["quality"] = self.quality if self.codec == "mp3" else None
+        
+        return key
+
+#Functions
+#----------
+
+# Function: getDefaultProfile(settings, dest_path)
+# Arguments:
+#   - settings: Settings of the converter
+#   - dest_path: Path of the destination library
+# Description: Returns the profile used if no profiles are given, which converts to MP3 using 'bitrate', processes covers according to 'convert_cover', 'scale_cover' and 'cover_scale' and writes ReplayGain tags if 'replaygain' is set.
+
+def getDefaultProfile(settings, dest_path):
+    return EncodeProfile("default", dest_path, "mp3", "cbr", settings["bitrate"], 2, settings["convert_cover"], settings["cover_scale"] if settings["scale_cover"] else 0, settings["replaygain"])
+
+# Function: parseProfile(text, settings)
+# Arguments:
+#   - text: Profile in the form "<name>:<key>=<value>,...". Possible keys are 'dest', 'codec', 'mode', 'bitrate', 'quality' and 'scale-cover', as well as 'convert-cover' and 'replaygain', which are enabled without a value or with 'true', '1' or 'yes'.
+#   - settings: Settings of the converter, which are used for the bitrate, the cover processing and ReplayGain if the profile doesn't contain them
+# Description: Parses a profile given on the command line. Raises ValueError if it is invalid.
+
+def parseProfile(text, settings):
+    name, separator, options = text.partition(":")
+    
+    if name == "":
+        raise ValueError("Missing profile name")
+    
+    values = {}
+    
+    for option in options.split(","):
+        if option == "":
+            continue
+        
+        key, separator, value = option.partition("=")
+        values[key.strip().lower()] = value.strip()
+    
+    unknown_keys = set(values) - {"dest", "codec", "mode", "bitrate", "quality", "scale-cover", "convert-cover", "replaygain"}
+    
+    if len(unknown_keys) > 0:
+        raise ValueError("Unknown option(s) in profile '"+name+"': "+", ".join(sorted(unknown_keys)))
+    
+    for key in ("convert-cover", "replaygain"):
+        if values.get(key, "").lower() not in boolean_values:
+            raise ValueError("Invalid value '"+values[key]+"' for '"+key+"' in profile '"+name+"'. Expected true, false, 1, 0, yes or no")
+    
+    codec = values.get("codec", "mp3").lower()
+    
+    if codec not in codecs:
+        raise ValueError("Unknown codec '"+codec+"' in profile '"+name+"'. Expected one of: "+", ".join(codecs))
+    
+    mode = values.get("mode", "vbr" if codec == "opus" else "cbr").lower()
+    
+    if mode not in bitrate_modes:
+        raise ValueError("Unknown bitrate mode '"+mode+"' in profile '"+name+"'. Expected one of: "+", ".join(bitrate_modes))
+    
+    if "bitrate" in values:
+        bitrate = values["bitrate"].lower()
+    elif codec == "mp3":
+        bitrate = settings["bitrate"]
+    else:
+        bitrate = codecs[codec]["bitrate"]
+    
+    if bitrate_format.match(bitrate) is None or int(bitrate[:-1]) == 0:
+        raise ValueError("Invalid bitrate '"+bitrate+"' in profile '"+name+"'. Expected kbit/s like '320k'")
+    
+    quality = values.get("quality", "2")
+    
+    if re.fullmatch("[0-9]", quality) is None:
+        raise ValueError("Invalid quality '"+quality+"' in profile '"+name+"'. Expected Integer between 0 and 9")
+    
+    cover_size = values.get("scale-cover", str(settings["cover_scale"]) if settings["scale_cover"] else "0")
+    
+    if not cover_size.isdigit():
+        raise ValueError("Invalid cover size '"+cover_size+"' in profile '"+name+"'. Expected Integer")
+    
+    destination = os.path.abspath(values["dest"]) if values.get("dest", "") != "" else None
+    #Options given in the profile override the command line options
+    convert_cover = boolean_values[values["convert-cover"].lower()] if "convert-cover" in values else settings["convert_cover"]
+    replaygain = boolean_values[values["replaygain"].lower()] if "replaygain" in values else settings["replaygain"]
+    
+    return EncodeProfile(name, destination, codec, mode, bitrate, int(quality), convert_cover, int(cover_size), replaygain)
+
+# Function: resolveProfiles(settings, dest_path)
+# Arguments:
+#   - settings: Settings of the converter
+#   - dest_path: Path of the destination library
+# Description: Returns the profiles of the settings, or the default profile if there are none. Profiles without destination are written to 'dest_path'. Raises ValueError if two profiles have the same name or destination.
+
+def resolveProfiles(settings, dest_path):
+    if len(settings["profiles"]) == 0:
+        return [getDefaultProfile(settings, dest_path)]
+    
+    profiles = []
+    names = set()
+    destinations = set()
+    
+    for profile in settings["profiles"]:
+        profile = dataclasses.replace(profile, destination=os.path.abspath(profile.destination or dest_path))
+        
+        if profile.codec not in codecs or profile.mode not in bitrate_modes:
+            raise ValueError("Invalid codec or bitrate mode in profile '"+profile.name+"'")
+        
+        if profile.name in names:
+            raise ValueError("There are multiple profiles named '"+profile.name+"'")
+        
+        if profile.destination in destinations:
+            raise ValueError("Profile '"+profile.name+"' has the same destination as another profile: "+profile.destination)
+        
+        names.add(profile.name)
+        destinations.add(profile.destination)
+        profiles.append(profile)
+    
+    return profiles
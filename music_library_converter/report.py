@@ -0,0 +1,107 @@
+# coding: utf8
+
+# Music Library Converter - Report
+# by JoeJoeTV - 2020,2021
+# Collects the timings of executed jobs and writes the run report
+
+
+import csv
+import json
+import math
+
+#Functions
+#----------
+
+# Function: createReportRecord(result)
+# Arguments:
+#   - result: Result of a finished job
+# Description: Returns the timings, sizes and the exit code of the job as a record of the run report.
+
+def createReportRecord(result):
+    job = result.job
+    
+    return {
+        "type": job.type,
+        "source": job.source,
+        "destination": job.destination,
+        "success": result.success,
+        "exit_code": job.exit_code,
+        "input_bytes": job.size,
+        "output_bytes": result.output_bytes,
+        "cover_bytes": job.cover_bytes,
+        "time": job.time,
+        "stages": job.timings
+    }
+
+# Function: percentile(values, fraction)
+# Arguments:
+#   - values: Sorted list of numbers
+#   - fraction: Fraction between 0 and 1 (e.g. 0.95 for the 95th percentile)
+# Description: Returns the given percentile of the values using the nearest rank method.
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0
+    
+    return values[max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))]
+
+# Function: getStageStatistics(records)
+# Arguments:
+#   - records: Records of the run report
+# Description: Returns the number of jobs, the total time, the median, the 95th percentile and the maximum for every stage in the report, as well as for the whole jobs ("total").
+
+def getStageStatistics(records):
+    stage_times = {"total": []}
+    
+    for record in records:
+        stage_times["total"].append(record["time"])
+        
+        for stage, seconds in record["stages"].items():
+            stage_times.setdefault(stage, []).append(seconds)
+    
+    statistics = {}
+    
+    for stage, times in stage_times.items():
+        times.sort()
+        statistics[stage] = {
+            "count": len(times),
+            "total": sum(times),
+            "p50": percentile(times, 0.5),
+            "p95": percentile(times, 0.95),
+            "max": times[-1] if len(times) > 0 else 0
+        }
+    
+    return statistics
+
+# Function: getSlowestRecords(records, count)
+# Arguments:
+#   - records: Records of the run report
+#   - count: Number of records, which should be returned
+# Description: Returns the records of the slowest jobs in the report.
+
+def getSlowestRecords(records, count):
+    return sorted(records, key=lambda record: record["time"], reverse=True)[:count]
+
+# Function: writeReport(path, records, information)
+# Arguments:
+#   - path: Path of the report file. If it ends with ".csv", one row per job is written as CSV, otherwise the whole report is written as JSON.
+#   - records: Records of the run report
+#   - information: Dictionary of additional information about the run (e.g. the statistics and the slowest jobs), which is written before the records in the JSON report
+# Description: Writes the machine-readable run report.
+
+def writeReport(path, records, information):
+    if path.lower().endswith(".csv"):
+        stages = sorted(set(stage for record in records for stage in record["stages"]))
+        
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["type", "source", "destination", "success", "exit_code", "input_bytes", "output_bytes", "cover_bytes", "time"] + stages)
+            
+            for record in records:
+                writer.writerow([record["type"], record["source"], record["destination"], record["success"], "" if record["exit_code"] is None else record["exit_code"], record["input_bytes"], record["output_bytes"], record["cover_bytes"], "{0:.6f}".format(record["time"])] + ["{0:.6f}".format(record["stages"][stage]) if stage in record["stages"] else "" for stage in stages])
+    else:
+        report = dict(information)
+        report["records"] = records
+        
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
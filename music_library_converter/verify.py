@@ -0,0 +1,252 @@
+# coding: utf8
+
+# Music Library Converter - Verification
+# by JoeJoeTV - 2020,2021
+# Checks converted and copied files for truncation and missing audio without decoding them
+
+
+import os
+import struct
+
+from .metadata import syncsafeInt, readFLACMetadata
+
+#Variables and Constants
+#------------------------
+
+#Bitrates in kbit/s by MPEG version (1 or 2, which includes 2.5) and layer, indexed by the bitrate index of the frame header
+mpeg_bitrates = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+#Sample rates by the version bits of the frame header (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+mpeg_sample_rates = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000)
+}
+#Tags of the Xing/Info and VBRI frames, which encoders put before the audio frames. They are searched in the first bytes after the header of the first frame.
+info_frame_tags = (b"Xing", b"Info", b"VBRI")
+info_frame_area = 40
+#Maximum difference in seconds between the duration of a converted file and its source. Encoders add up to a few frames of delay and padding.
+duration_tolerance = 0.5
+
+#Functions
+#----------
+
+# Function: parseMPEGHeader(header)
+# Arguments:
+#   - header: The 4 bytes of an MPEG audio frame header
+# Description: Returns the length of the frame in bytes, the number of samples in the frame and the sample rate, or None if 'header' is not a valid frame header. Free format frames are not supported.
+
+def parseMPEGHeader(header):
+    if header[0] != 0xff or (header[1] & 0xe0) != 0xe0:
+        return None
+    
+    version_bits = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    
+    version = 1 if version_bits == 3 else 2
+    bitrate = mpeg_bitrates[(version, layer)][bitrate_index] * 1000
+    sample_rate = mpeg_sample_rates[version_bits][sample_rate_index]
+    
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    elif layer == 2 or version == 1:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    else:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+# Function: walkMPEGFrames(path)
+# Arguments:
+#   - path: Path of an MP3 file
+# Description: Walks over the audio frames of the file, skipping ID3v2, ID3v1 and APEv2 tags and a leading Xing/Info or VBRI frame. Returns the number of frames and samples, the sample rate, the number of junk bytes, if the last frame is incomplete and an error message for incomplete tags.
+
+def walkMPEGFrames(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    
+    walk = {"frames": 0, "samples": 0, "sample_rate": 0, "junk_bytes": 0, "info_frame": False, "truncated": False, "error": ""}
+    pos = 0
+    end = len(data)
+    
+    if data[0:3] == b"ID3":
+        if end < 10:
+            walk["error"] = "The ID3v2 tag is incomplete"
+            return walk
+        
+        pos = 10 + syncsafeInt(data[6:10]) + (10 if data[5] & 0x10 else 0)
+        
+        if pos > end:
+            walk["error"] = "The ID3v2 tag is incomplete"
+            return walk
+    
+    if end - pos >= 128 and data[end-128:end-125] == b"TAG":
+        end -= 128
+    
+    if end - pos >= 32 and data[end-32:end-24] == b"APETAGEX":
+        #The size in the footer includes the footer, but not the optional header
+        tag_size = int.from_bytes(data[end-20:end-16], "little")
+        tag_flags = int.from_bytes(data[end-12:end-8], "little")
+        end -= tag_size + (32 if tag_flags & 0x80000000 else 0)
+    
+    while end - pos >= 4:
+        frame = parseMPEGHeader(data[pos:pos+4])
+        
+        if frame is None:
+            #Search for the next possible frame
+            next_pos = data.find(b"\xff", pos + 1, end)
+            
+            if next_pos == -1:
+                next_pos = end
+            
+            walk["junk_bytes"] += next_pos - pos
+            pos = next_pos
+            continue
+        
+        frame_length, samples, sample_rate = frame
+        
+        if pos + frame_length > end:
+            walk["truncated"] = True
+            return walk
+        
+        #The Xing/Info or VBRI frame contains no audio, but some muxers add or remove it when copying the stream
+        if walk["frames"] == 0 and not walk["info_frame"] and any(tag in data[pos+4:pos+info_frame_area] for tag in info_frame_tags):
+            walk["info_frame"] = True
+            pos += frame_length
+            continue
+        
+        walk["frames"] += 1
+        walk["samples"] += samples
+        walk["sample_rate"] = sample_rate
+        pos += frame_length
+    
+    #Less than a frame header is left
+    if pos < end:
+        walk["truncated"] = True
+    
+    return walk
+
+# Function: readOggDuration(path)
+# Arguments:
+#   - path: Path of an Opus file
+# Description: Calculates the duration of the Opus file from the pre-skip in its header and the granule position of the last Ogg page. Returns the duration, if the last page is complete and an error message for a broken header, or None if the file is not an Ogg file.
+
+def readOggDuration(path):
+    with open(path, "rb") as f:
+        head = f.read(65536)
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    
+    if head[0:4] != b"OggS":
+        return None
+    
+    opus_head = head.find(b"OpusHead")
+    
+    #The identification header has 19 bytes and a sample rate of 48000 Hz is used for the granule position in any case
+    if opus_head == -1 or len(head) < opus_head + 19:
+        return {"duration": 0, "complete": False, "error": "The Opus header is missing or incomplete"}
+    
+    pre_skip = int.from_bytes(head[opus_head+10:opus_head+12], "little")
+    
+    page = tail[tail.rfind(b"OggS"):]
+    
+    if len(page) < 27 or len(page) < 27 + page[26]:
+        return {"duration": 0, "complete": False, "error": ""}
+    
+    segment_count = page[26]
+    page_length = 27 + segment_count + sum(page[27:27+segment_count])
+    granule_position = int.from_bytes(page[6:14], "little", signed=True)
+    
+    return {
+        "duration": max(0, granule_position - pre_skip) / 48000,
+        "complete": page_length == len(page) and bool(page[5] & 0x04),
+        "error": ""
+    }
+
+# Function: checkOutput(source, destination, source_type)
+# Arguments:
+#   - source: Path of the source file
+#   - destination: Path of the converted or copied file
+#   - source_type: Type of the source file ("mp3", "flac", "lrc", "cue" or "art")
+# Description: Checks if the output is complete without decoding it, comparing the frames of copied MP3 files and the duration of converted FLAC files with the source. Returns an error message describing the problem, which is empty if the output is fine.
+
+def checkOutput(source, destination, source_type):
+    if source_type == "lrc":
+        if os.path.getsize(destination) != os.path.getsize(source):
+            return "The size differs from the source"
+        return ""
+    
+    #Cue sheets and folder art can be changed, so they only have to exist
+    if source_type in ("cue", "art"):
+        if os.path.getsize(destination) == 0:
+            return "The file is empty"
+        return ""
+    
+    if source_type == "mp3":
+        output = walkMPEGFrames(destination)
+        original = walkMPEGFrames(source)
+        
+        if output["error"] != "":
+            return output["error"]
+        
+        if output["truncated"] and not original["truncated"]:
+            return "The last frame is incomplete"
+        
+        if output["frames"] != original["frames"]:
+            return "Contains {0} instead of {1} frames".format(output["frames"], original["frames"])
+        
+        return ""
+    
+    #A source with broken tags was converted anyway, only its duration is unknown then
+    try:
+        with open(source, "rb") as f:
+            streaminfo = readFLACMetadata(f)["streaminfo"]
+    except (ValueError, IndexError, struct.error):
+        streaminfo = None
+    
+    if os.path.splitext(destination)[1].lower() == ".opus":
+        ogg = readOggDuration(destination)
+        
+        if ogg is None:
+            return "Not an Ogg file"
+        
+        if ogg["error"] != "":
+            return ogg["error"]
+        
+        if not ogg["complete"]:
+            return "The last page is incomplete"
+        
+        duration = ogg["duration"]
+    else:
+        output = walkMPEGFrames(destination)
+        
+        if output["error"] != "":
+            return output["error"]
+        
+        if output["frames"] == 0 or output["sample_rate"] == 0:
+            return "Contains no MPEG frames"
+        
+        if output["truncated"]:
+            return "The last frame is incomplete"
+        
+        duration = output["samples"] / output["sample_rate"]
+    
+    #The number of samples is optional in the STREAMINFO
+    if streaminfo is not None and streaminfo["total_samples"] > 0 and streaminfo["sample_rate"] > 0:
+        expected_duration = streaminfo["total_samples"] / streaminfo["sample_rate"]
+        
+        if abs(duration - expected_duration) > duration_tolerance:
+            return "Lasts {0:.2f}s instead of {1:.2f}s".format(duration, expected_duration)
+    
+    return ""
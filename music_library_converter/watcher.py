@@ -0,0 +1,427 @@
+# coding: utf8
+
+# Music Library Converter - Watcher
+# by JoeJoeTV - 2020,2021
+# Watches the source library and converts files as soon as they were completely written
+
+
+import os
+import time
+import struct
+import asyncio
+import logging
+import ctypes
+import ctypes.util
+
+from .jobs import job_types
+from .planner import scanDirectories
+
+#Variables and Constants
+#------------------------
+
+logger = logging.getLogger(__name__)
+
+#Flags of inotify (see 'man 7 inotify')
+in_attrib = 0x00000004
+in_close_write = 0x00000008
+in_moved_from = 0x00000040
+in_moved_to = 0x00000080
+in_create = 0x00000100
+in_delete = 0x00000200
+in_q_overflow = 0x00004000
+in_ignored = 0x00008000
+in_onlydir = 0x01000000
+in_isdir = 0x40000000
+in_nonblock = os.O_NONBLOCK
+in_cloexec = getattr(os, "O_CLOEXEC", 0)
+#Events watched in every directory. Writes to a file aren't watched, as files are only processed after they stopped growing anyway.
+inotify_mask = in_attrib | in_close_write | in_moved_from | in_moved_to | in_create | in_delete | in_onlydir
+#Header of every inotify event: watch descriptor, mask, cookie and length of the name
+inotify_event = struct.Struct("iIII")
+
+#Classes
+#--------
+
+# Class: InotifyWatcher
+# Description: Watches a directory and all of its subdirectories using inotify, which is called using ctypes, so no additional library is needed. Only available on Linux.
+
+class InotifyWatcher:
+
+    # Method: __init__(path)
+    # Arguments:
+    #   - path: Path of the watched directory
+    # Description: Creates the inotify instance and watches all directories. Raises OSError if inotify is not available.
+
+    def __init__(self, path):
+        self.path = path
+        self.directories = {}
+        
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(in_nonblock | in_cloexec)
+        except (OSError, AttributeError, TypeError):
+            raise OSError("inotify is not available")
+        
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, "inotify is not available: "+os.strerror(error))
+        
+        self.addDirectory(path)
+
+    # Method: addDirectory(path)
+    # Arguments:
+    #   - path: Path of a directory inside of the watched directory
+    # Description: Watches the directory and all of its subdirectories and returns the paths of the files inside of them. Every directory is watched before it is listed, so no file created in the meantime is missed.
+
+    def addDirectory(self, path):
+        directories = [path]
+        files = []
+        
+        while len(directories) > 0:
+            directory = directories.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), inotify_mask)
+            
+            if wd < 0:
+                logger.warning("Could not watch directory "+directory+": "+os.strerror(ctypes.get_errno()))
+                continue
+            
+            self.directories[wd] = directory
+            
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.path)
+            except OSError as err:
+                logger.warning("Could not scan directory "+directory+": "+str(err))
+        
+        return files
+
+    # Method: removeDirectory(path)
+    # Arguments:
+    #   - path: Path of a directory, which was moved or deleted
+    # Description: Stops watching the directory and all of its subdirectories.
+
+    def removeDirectory(self, path):
+        for wd, directory in list(self.directories.items()):
+            if directory == path or directory.startswith(path+os.sep):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.directories[wd]
+
+    # Method: readEvents()
+    # Description: Reads all available inotify events without blocking and returns them as a list of tuples of the event ("changed", "removed", "removed_directory" or "rescan") and the path. Files inside of new directories get a "changed" event each.
+
+    def readEvents(self):
+        events = []
+        
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            
+            pos = 0
+            
+            while pos + inotify_event.size <= len(data):
+                wd, mask, cookie, length = inotify_event.unpack_from(data, pos)
+                name = os.fsdecode(data[pos+inotify_event.size:pos+inotify_event.size+length].rstrip(b"\x00"))
+                pos += inotify_event.size + length
+                
+                #Directories created in the meantime aren't watched yet
+                if mask & in_q_overflow:
+                    self.addDirectory(self.path)
+                    events.append(("rescan", self.path))
+                    continue
+                
+                if mask & in_ignored:
+                    self.directories.pop(wd, None)
+                    continue
+                
+                directory = self.directories.get(wd)
+                
+                if directory is None or name == "":
+                    continue
+                
+                path = os.path.join(directory, name)
+                
+                if mask & in_isdir:
+                    if mask & (in_create | in_moved_to):
+                        events += [("changed", file_path) for file_path in self.addDirectory(path)]
+                    elif mask & (in_moved_from | in_delete):
+                        self.removeDirectory(path)
+                        events.append(("removed_directory", path))
+                elif mask & (in_moved_from | in_delete):
+                    events.append(("removed", path))
+                else:
+                    events.append(("changed", path))
+
+    # Method: getEvents(timeout)
+    # Arguments:
+    #   - timeout: Maximum number of seconds to wait for events
+    # Description: Coroutine waiting until there are events, as returned by 'readEvents', or the timeout is over.
+
+    async def getEvents(self, timeout):
+        events = self.readEvents()
+        
+        if len(events) > 0:
+            return events
+        
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        loop.add_reader(self.fd, lambda: readable.done() or readable.set_result(True))
+        
+        try:
+            await asyncio.wait([readable], timeout=timeout)
+        finally:
+            loop.remove_reader(self.fd)
+        
+        return self.readEvents()
+
+    # Method: close()
+    # Description: Stops watching all directories.
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.directories = {}
+
+# Class: PollingWatcher
+# Description: Watches a directory and all of its subdirectories by scanning them regularly and comparing the size and modification time of all files. Used if inotify is not available.
+
+class PollingWatcher:
+
+    # Method: __init__(path, interval=5)
+    # Arguments:
+    #   - path: Path of the watched directory
+    #   - interval: Seconds between two scans. Defaults to 5.
+    # Description: Creates the watcher and scans the directory for the first time.
+
+    def __init__(self, path, interval=5):
+        self.path = path
+        self.interval = interval
+        self.files = self.scan()
+        self.last_scan = time.monotonic()
+
+    # Method: scan()
+    # Description: Returns the size and modification time of every file in the watched directory by path.
+
+    def scan(self):
+        files = {}
+        
+        for directory, entries in scanDirectories(self.path):
+            for entry in entries:
+                try:
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+                
+                files[entry.path] = (entry_stat.st_size, entry_stat.st_mtime_ns)
+        
+        return files
+
+    # Method: getEvents(timeout)
+    # Arguments:
+    #   - timeout: Maximum number of seconds to wait for events
+    # Description: Coroutine scanning the directory, if the last scan was at least 'interval' seconds ago, and returning the changes in the same form as 'InotifyWatcher.readEvents'. Otherwise waits until the next scan is due or the timeout is over.
+
+    async def getEvents(self, timeout):
+        remaining = self.last_scan + self.interval - time.monotonic()
+        
+        if remaining > 0:
+            await asyncio.sleep(min(remaining, timeout))
+            return []
+        
+        files = await asyncio.get_running_loop().run_in_executor(None, self.scan)
+        self.last_scan = time.monotonic()
+        
+        events = [("changed", path) for path, state in files.items() if self.files.get(path) != state]
+        events += [("removed", path) for path in self.files if path not in files]
+        self.files = files
+        
+        return events
+
+    # Method: close()
+    # Description: Stops watching the directory.
+
+    def close(self):
+        self.files = {}
+
+# Class: LibraryWatcher
+# Description: Watches the source library of a converter and converts or copies new and changed files, once they stopped growing.
+
+class LibraryWatcher:
+
+    # Method: __init__(converter, settle_time=2, poll_interval=0)
+    # Arguments:
+    #   - converter: Opened converter, whose source library is watched
+    #   - settle_time: Seconds, for which the size and modification time of a file must not change, before it is processed. Defaults to 2.
+    #   - poll_interval: Seconds between two scans of the library, if it is polled. Defaults to 0, in which case inotify is used if it is available and the library is polled every 5 seconds otherwise.
+    # Description: Creates the watcher. Watching only starts with 'start', which should be called before the library is planned, so no file is missed.
+
+    def __init__(self, converter, settle_time=2, poll_interval=0):
+        self.converter = converter
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.watcher = None
+        #State and time of the last change of every file, which is still being written
+        self.pending = {}
+        self.ready = []
+        self.removed = []
+        self.rescan = False
+
+    # Method: start()
+    # Description: Starts watching the source library. Falls back to polling if inotify is not available.
+
+    def start(self):
+        if self.poll_interval == 0:
+            try:
+                self.watcher = InotifyWatcher(self.converter.source_path)
+                return
+            except OSError as err:
+                logger.warning(str(err)+", polling the source library instead")
+        
+        self.watcher = PollingWatcher(self.converter.source_path, self.poll_interval or 5)
+
+    # Method: close()
+    # Description: Stops watching the source library.
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    # Method: isPolling()
+    # Description: Checks if the source library is polled instead of being watched using inotify.
+
+    def isPolling(self):
+        return isinstance(self.watcher, PollingWatcher)
+
+    # Method: addEvents(events)
+    # Arguments:
+    #   - events: List of events as returned by 'InotifyWatcher.readEvents'
+    # Description: Adds changed files of supported types to the pending files. In mirror mode, removed files of supported types and removed directories are remembered, while other removals (e.g. temporary files renamed by rsync) are ignored.
+
+    def addEvents(self, events):
+        now = time.monotonic()
+        
+        for event, path in events:
+            if event == "rescan":
+                self.rescan = True
+            elif event in ("removed", "removed_directory"):
+                self.pending.pop(path, None)
+                
+                if self.converter.settings["mirror"] and (event == "removed_directory" or os.path.splitext(path)[1].lower() in job_types):
+                    self.removed.append(path)
+            elif os.path.splitext(path)[1].lower() in job_types:
+                self.pending[path] = (None, now)
+
+    # Method: checkPending()
+    # Description: Compares the size and modification time of every pending file with the last check and moves the files, which didn't change for 'settle_time' seconds, to the ready files. Files, which no longer exist, are dropped.
+
+    def checkPending(self):
+        now = time.monotonic()
+        
+        for path, (state, since) in list(self.pending.items()):
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            
+            current_state = (file_stat.st_size, file_stat.st_mtime_ns)
+            
+            if current_state != state:
+                self.pending[path] = (current_state, now)
+            elif now - since >= self.settle_time:
+                del self.pending[path]
+                self.ready.append(path)
+
+    # Method: getMoveSizes(removed)
+    # Arguments:
+    #   - removed: Paths of removed files and directories
+    # Description: Returns the set of sizes of the removed source files, which have a fingerprint in one of the manifests and can therefore be matched to a moved file.
+
+    def getMoveSizes(self, removed):
+        converter = self.converter
+        removed_paths = [os.path.relpath(os.path.abspath(path), converter.source_path) for path in removed]
+        sizes = set()
+        
+        for manifest in converter.manifests.values():
+            for key, entry in manifest.entries.items():
+                if entry["fingerprint"] is not None and any(key == path or key.startswith(path+os.sep) for path in removed_paths):
+                    sizes.add(entry["size"])
+        
+        return sizes
+
+    # Method: takeJobs()
+    # Description: Returns the jobs for the ready and removed files as created by 'Converter.planChanges', or for the whole library if events were lost. Removed files and ready files of the same size are kept back while files are pending, as they could be moves.
+
+    async def takeJobs(self):
+        converter = self.converter
+        
+        if self.rescan:
+            logger.warning("Events of the source library were lost, scanning it again")
+            self.rescan = False
+            self.ready = []
+            self.removed = []
+            return await converter.runBlocking(converter.plan)
+        
+        if len(self.ready) == 0 and len(self.removed) == 0:
+            return []
+        
+        ready = self.ready
+        removed = self.removed
+        self.ready = []
+        self.removed = []
+        
+        #The files of a moved directory may still be arriving
+        if len(removed) > 0 and len(self.pending) > 0:
+            move_sizes = await converter.runBlocking(self.getMoveSizes, removed)
+            
+            if len(move_sizes) > 0:
+                self.removed = removed
+                removed = []
+                unmatched = []
+                
+                for path in ready:
+                    try:
+                        size = os.stat(path).st_size
+                    except OSError:
+                        size = None
+                    
+                    if size in move_sizes:
+                        self.ready.append(path)
+                    else:
+                        unmatched.append(path)
+                
+                ready = unmatched
+                
+                if len(ready) == 0:
+                    return []
+        
+        return await converter.runBlocking(converter.planChanges, ready, removed)
+
+    # Method: iterResults()
+    # Description: Asynchronous generator waiting for changes of the source library and yielding the results of the jobs executed for them. Runs until it is cancelled. The manifests are committed after every batch of files.
+
+    async def iterResults(self):
+        if self.watcher is None:
+            self.start()
+        
+        while True:
+            self.addEvents(await self.watcher.getEvents(0.5))
+            self.checkPending()
+            
+            jobs = await self.takeJobs()
+            
+            if len(jobs) == 0:
+                continue
+            
+            async for result in self.converter.iterResults(jobs):
+                yield result
+            
+            for manifest in self.converter.manifests.values():
+                manifest.commit()
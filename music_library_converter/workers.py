@@ -0,0 +1,239 @@
+# coding: utf8
+
+# Music Library Converter - Workers
+# by JoeJoeTV - 2020,2021
+# Splits the work between several converters, which can run on different hosts sharing the same libraries
+
+
+import os
+import time
+import json
+import socket
+import hashlib
+
+#Functions
+#----------
+
+# Function: getShard(relpath, shard_count)
+# Arguments:
+#   - relpath: Path of a source file relative to the source library
+#   - shard_count: Number of shards
+# Description: Returns the shard (from 1 to 'shard_count') of the source file, which is determined by the hash of its path. Paths are compared with "/" as separator, so every host gets the same shards.
+
+def getShard(relpath, shard_count):
+    path_hash = hashlib.blake2b(relpath.replace(os.sep, "/").encode("utf-8", "surrogateescape"), digest_size=8).digest()
+    return int.from_bytes(path_hash, "big") % shard_count + 1
+
+#Classes
+#--------
+
+# Class: WorkClaims
+# Description: Lease files in a claim directory shared by several converters, so every source file is only processed by one of them. Leases, which weren't renewed within 'timeout' seconds, are stolen, and done markers only apply to jobs planned before the file was processed.
+
+class WorkClaims:
+
+    # Method: __init__(directory, timeout=120)
+    # Arguments:
+    #   - directory: Path of the shared state directory, which is created if necessary
+    #   - timeout: Seconds after which a lease, which wasn't renewed, can be stolen. Defaults to 120.
+    # Description: Creates the work claims of this converter, identified by the host name and the process ID.
+
+    def __init__(self, directory, timeout=120):
+        self.directory = directory
+        self.timeout = timeout
+        self.owner = socket.gethostname()+"-"+str(os.getpid())
+        os.makedirs(directory, exist_ok=True)
+
+    # Method: getPath(job, source_path)
+    # Arguments:
+    #   - job: Job of the source file
+    #   - source_path: Path of the source library
+    # Description: Returns the path of the lease file of the job's source file, which consists of the hash of its relative path, size and modification time.
+
+    def getPath(self, job, source_path):
+        relpath = os.path.relpath(job.source, source_path).replace(os.sep, "/")
+        return self.getKeyPath(relpath+"\x00"+str(job.size)+"\x00"+str(job.mtime))
+
+    # Method: getAlbumPath(profile, directory, source_path)
+    # Arguments:
+    #   - profile: Encode profile writing ReplayGain tags
+    #   - directory: Source directory of the album
+    #   - source_path: Path of the source library
+    # Description: Returns the path of the lease, which is held while the album gain of the directory is written for the profile.
+
+    def getAlbumPath(self, profile, directory, source_path):
+        relpath = os.path.relpath(directory, source_path).replace(os.sep, "/")
+        return self.getKeyPath("album\x00"+profile.name+"\x00"+relpath)
+
+    # Method: getKeyPath(key)
+    # Arguments:
+    #   - key: Text identifying the claimed work
+    # Description: Returns the path of the lease file, which consists of the hash of the key.
+
+    def getKeyPath(self, key):
+        key = hashlib.blake2b(key.encode("utf-8", "surrogateescape"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, key[0:2], key+".lease")
+
+    # Method: createLease(path, source)
+    # Arguments:
+    #   - path: Path of the lease
+    #   - source: Path of the claimed source file or directory
+    # Description: Creates the lease, if it doesn't exist yet. Returns True, if it was created.
+
+    def createLease(self, path, source):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        
+        with os.fdopen(fd, "w") as f:
+            json.dump({"owner": self.owner, "source": source, "time": time.time()}, f)
+        
+        return True
+
+    # Method: claim(job, source_path)
+    # Arguments:
+    #   - job: Job of the source file
+    #   - source_path: Path of the source library
+    # Description: Tries to create the lease of the job's source file. Returns the path of the lease or None, if the file was processed after the job was planned or another converter holds a valid lease.
+
+    def claim(self, job, source_path):
+        return self.claimPath(self.getPath(job, source_path), job.source, job.planned)
+
+    # Method: claimAlbum(profile, directory, source_path, planned)
+    # Arguments:
+    #   - profile: Encode profile writing ReplayGain tags
+    #   - directory: Source directory of the album
+    #   - source_path: Path of the source library
+    #   - planned: Time, at which the jobs of the album were planned
+    # Description: Tries to create the lease for writing the album gain of the directory like 'claim', waiting while another converter holds it. Returns None, if the album gain was written after the jobs were planned.
+
+    def claimAlbum(self, profile, directory, source_path, planned):
+        path = self.getAlbumPath(profile, directory, source_path)
+        
+        while True:
+            lease = self.claimPath(path, directory, planned)
+            
+            if lease is not None or self.isDone(path, planned):
+                return lease
+            
+            time.sleep(1)
+
+    # Method: claimPath(path, source, planned)
+    # Arguments:
+    #   - path: Path of the lease
+    #   - source: Path of the claimed source file or directory
+    #   - planned: Time, at which the work was planned
+    # Description: Tries to create the lease. Returns its path or None, if the work was done after it was planned or another converter holds a valid lease.
+
+    def claimPath(self, path, source, planned):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        if self.isDone(path, planned):
+            return None
+        
+        if self.createLease(path, source) or self.stealLease(path, source):
+            return path
+        
+        return None
+
+    # Method: isDone(path, planned)
+    # Arguments:
+    #   - path: Path of a lease
+    #   - planned: Time, at which the work was planned
+    # Description: Checks if the lease was turned into a done marker after the work was planned. Done markers of earlier runs are ignored, the manifest decides if the file has to be processed again.
+
+    def isDone(self, path, planned):
+        try:
+            return os.stat(path+".done").st_mtime >= planned
+        except FileNotFoundError:
+            return False
+
+    # Method: isStale(path)
+    # Arguments:
+    #   - path: Path of a lease
+    # Description: Checks if the lease wasn't renewed within 'timeout' seconds or doesn't exist anymore.
+
+    def isStale(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime >= self.timeout
+        except FileNotFoundError:
+            return True
+
+    # Method: removeStale(path)
+    # Arguments:
+    #   - path: Path of a stale lease
+    # Description: Removes the lease, if it is still stale, and puts back a new lease, which replaced it in the meantime. Returns True, if the lease was removed or didn't exist anymore.
+
+    def removeStale(self, path):
+        own_path = path+".stale-"+self.owner
+        
+        try:
+            os.rename(path, own_path)
+        except FileNotFoundError:
+            return True
+        
+        try:
+            if not self.isStale(own_path):
+                try:
+                    os.link(own_path, path)
+                except FileExistsError:
+                    pass
+                
+                return False
+            
+            return True
+        finally:
+            os.remove(own_path)
+
+    # Method: stealLease(path, source)
+    # Arguments:
+    #   - path: Path of an existing lease
+    #   - source: Path of the claimed source file or directory
+    # Description: Replaces the lease by a new one of this converter, if it is stale, while holding the steal lock next to it. Returns True, if the lease belongs to this converter now.
+
+    def stealLease(self, path, source):
+        if not self.isStale(path):
+            return False
+        
+        lock_path = path+".steal"
+        
+        if not self.createLease(lock_path, source):
+            if not (self.isStale(lock_path) and self.removeStale(lock_path) and self.createLease(lock_path, source)):
+                return False
+        
+        try:
+            #Another converter may have stolen the lease before the lock was taken
+            if not self.isStale(path) or not self.removeStale(path):
+                return False
+            
+            return self.createLease(path, source)
+        finally:
+            os.remove(lock_path)
+
+    # Method: renew(path)
+    # Arguments:
+    #   - path: Path of a lease created by 'claim'
+    # Description: Updates the modification time of the lease, so it doesn't become stale.
+
+    def renew(self, path):
+        os.utime(path)
+
+    # Method: release(path, done=True)
+    # Arguments:
+    #   - path: Path of a lease created by 'claim'
+    #   - done: If the file was processed successfully. Defaults to True.
+    # Description: Turns the lease into a done marker or, if the file wasn't processed successfully, removes it. Leases stolen by another converter are left alone.
+
+    def release(self, path, done=True):
+        try:
+            with open(path, "r") as f:
+                if json.load(f).get("owner") != self.owner:
+                    return
+            
+            if done:
+                os.replace(path, path+".done")
+            else:
+                os.remove(path)
+        except (OSError, ValueError):
+            pass